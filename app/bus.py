@@ -0,0 +1,127 @@
+# 导入所需的库
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+
+from app import config
+
+# --- 事件总线 ---
+#
+# 流程状态、取消请求和 WebSocket 广播都以事件的形式发布到总线上，
+# 每个进程根据收到的事件更新自己的状态副本，并推送给连接到本进程的客户端。
+# 默认的 InProcessBus 只在当前进程内分发；SQLiteBus 通过一个共享的 SQLite
+# 文件在同一台机器上的多个 uvicorn worker 之间分发事件。
+
+
+class InProcessBus:
+    """默认实现: 事件直接交给本进程的处理函数"""
+
+    def __init__(self):
+        # 当前进程的唯一标识，用于区分事件的来源
+        self.origin = uuid.uuid4().hex
+        self._handlers = []
+
+    def subscribe(self, handler):
+        """注册事件处理函数，签名为 async handler(event: dict, raw: str)"""
+        self._handlers.append(handler)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: dict):
+        await self._dispatch(event, json.dumps(event, ensure_ascii=False))
+
+    async def _dispatch(self, event: dict, raw: str):
+        for handler in self._handlers:
+            try:
+                await handler(event, raw)
+            except Exception as e:
+                print(f"处理事件 {event.get('type')} 时出错: {e}")
+
+
+class SQLiteBus(InProcessBus):
+    """本机多进程实现: 事件写入共享的 SQLite 文件，其他进程轮询读取"""
+
+    def __init__(self, path: str, poll_seconds: float, retention_seconds: float):
+        super().__init__()
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        self._conn = None
+        self._last_id = 0
+        self._last_prune = 0.0
+        self._task = None
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, created REAL NOT NULL, payload TEXT NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    async def start(self):
+        # 先回放保留期内的事件，恢复其他进程中正在运行的流程状态
+        await self._poll()
+        self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def publish(self, event: dict):
+        raw = json.dumps(event, ensure_ascii=False)
+        self._get_conn().execute(
+            "INSERT INTO events (origin, created, payload) VALUES (?, ?, ?)", (self.origin, time.time(), raw)
+        )
+        # 本进程的事件直接分发，不必等待轮询
+        await self._dispatch(event, raw)
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self._poll()
+            except Exception as e:
+                print(f"读取事件总线失败: {e}")
+
+    async def _poll(self):
+        conn = self._get_conn()
+        rows = conn.execute(
+            "SELECT id, origin, payload FROM events WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        for row_id, origin, raw in rows:
+            self._last_id = row_id
+            if origin != self.origin:
+                await self._dispatch(json.loads(raw), raw)
+
+        now = time.time()
+        if now - self._last_prune > 60:
+            self._last_prune = now
+            conn.execute("DELETE FROM events WHERE created < ?", (now - self.retention_seconds,))
+
+
+def create_bus():
+    """根据配置创建事件总线"""
+    if config.EVENT_BUS_BACKEND == "sqlite":
+        return SQLiteBus(config.EVENT_BUS_PATH, config.EVENT_BUS_POLL_SECONDS, config.EVENT_BUS_RETENTION_SECONDS)
+    if config.EVENT_BUS_BACKEND != "memory":
+        print(f"未知的事件总线类型 '{config.EVENT_BUS_BACKEND}'，使用进程内总线。")
+    return InProcessBus()
+
+
+# 全局事件总线
+bus = create_bus()
@@ -0,0 +1,156 @@
+# 导入所需的库
+import asyncio
+import gzip
+import json
+import os
+import time
+
+from app import config
+
+# --- venera 输出的录制与回放 ---
+#
+# 每个流程对应一个 gzip 压缩的 JSON Lines 文件，内容依次为:
+#   {"flow": ..., "kind": "full" | "batch", "args": {...}, "started": ...}    文件头 (旧版本还有 "single")
+#   {"cmd": "updatesubscribe", "index": 0}                                   命令开始
+#   [0, 0.125, "[CLI PRINT] {...}"]                                          [命令序号, 相对命令开始的秒数, 原始行]
+#   {"end": 0, "t": 3.5}                                                     命令结束
+
+
+class CaptureRecorder:
+    """将一个流程中每条命令的原始输出连同时间戳写入录制文件"""
+
+    def __init__(self, flow_id: str, kind: str, **args):
+        os.makedirs(config.CAPTURE_DIR, exist_ok=True)
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}_{flow_id}.jsonl.gz"
+        self.path = os.path.join(config.CAPTURE_DIR, filename)
+        self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        self._starts = []
+        self._write({"flow": flow_id, "kind": kind, "args": args, "started": time.time()})
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def begin(self, command: str) -> int:
+        """记录一条命令的开始，返回该命令在文件中的序号"""
+        index = len(self._starts)
+        self._starts.append(time.monotonic())
+        self._write({"cmd": command, "index": index})
+        return index
+
+    def line(self, index: int, line: str):
+        self._write([index, round(time.monotonic() - self._starts[index], 3), line])
+
+    def end(self, index: int):
+        self._write({"end": index, "t": round(time.monotonic() - self._starts[index], 3)})
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            prune_captures()
+
+
+class CaptureReplayer:
+    """读取录制文件，按命令依次提供原始输出行"""
+
+    def __init__(self, path: str, pacing: str = "fast"):
+        if pacing not in ("fast", "original"):
+            raise ValueError(f"未知的回放节奏: {pacing}")
+        self.path = path
+        self.pacing = pacing
+        self.header = {}
+        # 每个元素为 [命令, [(相对时间, 行), ...], 是否已被回放]
+        self._commands = []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for raw in f:
+                record = json.loads(raw)
+                if isinstance(record, list):
+                    index, offset, line = record
+                    self._commands[index][1].append((offset, line))
+                elif "flow" in record:
+                    self.header = record
+                elif "cmd" in record:
+                    self._commands.append([record["cmd"], [], False])
+
+    @property
+    def kind(self) -> str:
+        return self.header.get("kind", "full")
+
+    @property
+    def args(self) -> dict:
+        return self.header.get("args", {})
+
+    async def lines(self, command: str):
+        """按录制顺序取出下一条与 command 相同的命令的输出行"""
+        for entry in self._commands:
+            if entry[0] == command and not entry[2]:
+                entry[2] = True
+                break
+        else:
+            return
+
+        started = time.monotonic()
+        for offset, line in entry[1]:
+            if self.pacing == "original":
+                delay = started + offset - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                # 全速回放时也要让出事件循环，避免长时间阻塞其他协程
+                await asyncio.sleep(0)
+            yield line
+
+
+def start_recording(flow_id: str, kind: str, **args):
+    """如果开启了录制，则为该流程创建一个录制器，否则返回 None"""
+    if not config.RECORD_VENERA_OUTPUT:
+        return None
+    try:
+        return CaptureRecorder(flow_id, kind, **args)
+    except OSError as e:
+        print(f"创建录制文件失败: {e}")
+        return None
+
+
+def list_captures() -> list:
+    """列出所有录制文件，最新的在前"""
+    if not os.path.isdir(config.CAPTURE_DIR):
+        return []
+    names = [n for n in os.listdir(config.CAPTURE_DIR) if n.endswith(".jsonl.gz")]
+    return sorted(names, reverse=True)
+
+
+def get_capture_path(name: str) -> str:
+    """根据文件名获取录制文件路径，不允许跳出录制目录"""
+    path = os.path.join(config.CAPTURE_DIR, os.path.basename(name))
+    if not os.path.isfile(path):
+        raise FileNotFoundError(name)
+    return path
+
+
+def read_header(path: str) -> dict:
+    """只读取录制文件的头部 (流程ID、类型和参数)"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.loads(f.readline() or "{}")
+
+
+def prune_captures():
+    """只保留最近的 CAPTURE_KEEP 个录制文件"""
+    for name in list_captures()[config.CAPTURE_KEEP:]:
+        try:
+            os.remove(os.path.join(config.CAPTURE_DIR, name))
+        except OSError:
+            pass
+
+
+# --- 命令行回放 ---
+# python -m app.capture captures/xxx.jsonl.gz [--pacing original] [--send-email]
+if __name__ == "__main__":
+    import argparse
+    from app import services
+
+    parser = argparse.ArgumentParser(description="回放录制的 venera 输出")
+    parser.add_argument("capture", help="录制文件路径")
+    parser.add_argument("--pacing", choices=["fast", "original"], default="fast")
+    parser.add_argument("--send-email", action="store_true", help="回放时照常发送邮件通知")
+    cli_args = parser.parse_args()
+    asyncio.run(services.replay_capture(cli_args.capture, cli_args.pacing, cli_args.send_email))
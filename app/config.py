@@ -27,6 +27,10 @@ MAIL_RECIPIENT = get_env("MAIL_RECIPIENT")
 DATA_FILE = "data.json"
 CACHE_DIR = "cache/comic_cover"
 
+# 多账号配置文件 (不存在时只使用单个默认账号)，以及同时运行的 venera 进程数量上限
+PROFILES_FILE = get_env("PROFILES_FILE", "profiles.json")
+MAX_CONCURRENT_VENERA = int(get_env("MAX_CONCURRENT_VENERA", 2))
+
 # --- 高级配置 ---
 
 # 自动更新间隔 (分钟)
@@ -34,6 +38,47 @@ UPDATE_INTERVAL_MINUTES = int(get_env("UPDATE_INTERVAL_MINUTES", 60))
 # 命令执行超时时间 (秒)
 COMMAND_TIMEOUT_SECONDS = int(get_env("COMMAND_TIMEOUT_SECONDS", 120))
 
+# HTTP 响应: 超过该大小 (字节) 的响应才会压缩；静态资源的浏览器缓存时间 (秒)，0 表示每次都向服务器验证
+COMPRESS_MIN_BYTES = int(get_env("COMPRESS_MIN_BYTES", 1024))
+STATIC_CACHE_SECONDS = int(get_env("STATIC_CACHE_SECONDS", 0))
+
+# 订阅源 (/feeds/...) 的访问令牌，为空时只能通过登录后的会话访问
+FEED_TOKEN = get_env("FEED_TOKEN", "")
+# 订阅源中链接的前缀 (例如 https://example.com)，为空时使用相对链接
+FEED_BASE_URL = get_env("FEED_BASE_URL", "")
+
+# 封面下载超时 (秒) 和最大并发连接数
+COVER_FETCH_TIMEOUT_SECONDS = int(get_env("COVER_FETCH_TIMEOUT_SECONDS", 20))
+COVER_MAX_CONNECTIONS = int(get_env("COVER_MAX_CONNECTIONS", 16))
+# 封面下载失败后的重试退避: 首次等待时间和最长等待时间 (秒)，每次连续失败等待时间翻倍
+COVER_RETRY_BASE_SECONDS = int(get_env("COVER_RETRY_BASE_SECONDS", 300))
+COVER_RETRY_MAX_SECONDS = int(get_env("COVER_RETRY_MAX_SECONDS", 86400))
+# 同一主机连续连接失败多少次后，暂时跳过该主机上的所有封面
+COVER_HOST_FAILURE_THRESHOLD = int(get_env("COVER_HOST_FAILURE_THRESHOLD", 3))
+
+# 事件总线: memory (默认，单进程) 或 sqlite (同一台机器上的多个 worker 共享)
+EVENT_BUS_BACKEND = get_env("EVENT_BUS_BACKEND", "memory").lower()
+EVENT_BUS_PATH = get_env("EVENT_BUS_PATH", "event_bus.sqlite3")
+# sqlite 总线的轮询间隔 (秒) 和事件保留时间 (秒)
+EVENT_BUS_POLL_SECONDS = float(get_env("EVENT_BUS_POLL_SECONDS", 0.05))
+EVENT_BUS_RETENTION_SECONDS = int(get_env("EVENT_BUS_RETENTION_SECONDS", 3600))
+# 其他 worker 上的流程超过该时间 (秒) 没有任何事件，则视为已失效 (例如该 worker 已退出)
+FLOW_STALE_SECONDS = int(get_env("FLOW_STALE_SECONDS", 900))
+
+# 跨进程租约文件所在目录，以及租约有效期 (秒)，持有者退出后最多经过该时间即可被接管
+LEASE_DIR = get_env("LEASE_DIR", ".")
+LEASE_TTL_SECONDS = int(get_env("LEASE_TTL_SECONDS", 30))
+
+# 更新队列: 积压的单个漫画请求达到该数量时改为执行一次完整更新；流程锁被占用时的重试间隔 (秒)
+QUEUE_FULL_UPDATE_THRESHOLD = int(get_env("QUEUE_FULL_UPDATE_THRESHOLD", 5))
+QUEUE_RETRY_SECONDS = float(get_env("QUEUE_RETRY_SECONDS", 2))
+
+# 是否录制每个流程中 venera 的原始输出，用于之后的回放
+RECORD_VENERA_OUTPUT = get_env("RECORD_VENERA_OUTPUT", "false").lower() in ("1", "true", "yes")
+# 录制文件目录，以及最多保留的录制文件数量
+CAPTURE_DIR = "captures"
+CAPTURE_KEEP = int(get_env("CAPTURE_KEEP", 20))
+
 # --- .env 文件更新函数 ---
 
 # 更新 .env 文件中的配置项
@@ -0,0 +1,140 @@
+# 导入所需的库
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import anyio
+import httpx
+
+from app import config
+
+# --- 封面下载 ---
+#
+# 同一个 URL 的并发请求共享同一次下载 (single-flight)，
+# 下载失败的 URL 和持续无法连接的主机会按指数退避暂时跳过 (负缓存)。
+
+# 正在进行中的下载: URL -> asyncio.Task
+_inflight = {}
+# URL -> [连续失败次数, 下次允许重试的时间]
+_url_failures = {}
+# 主机名 -> [连续连接失败次数, 下次允许重试的时间]
+_host_failures = {}
+# 共享的 HTTP 客户端及其所属的事件循环
+_client = None
+_client_loop = None
+
+
+def is_remote_url(url: str) -> bool:
+    return bool(url) and url.startswith(('http://', 'https://'))
+
+
+def _backoff_seconds(count: int) -> float:
+    return min(config.COVER_RETRY_BASE_SECONDS * 2 ** max(count - 1, 0), config.COVER_RETRY_MAX_SECONDS)
+
+
+def _record_failure(table: dict, key: str, threshold: int = 1):
+    entry = table.setdefault(key, [0, 0.0])
+    entry[0] += 1
+    if entry[0] >= threshold:
+        entry[1] = time.monotonic() + _backoff_seconds(entry[0] - threshold + 1)
+
+
+def _in_backoff(table: dict, key: str) -> bool:
+    entry = table.get(key)
+    return bool(entry) and entry[1] > time.monotonic()
+
+
+def _get_client() -> httpx.AsyncClient:
+    """获取共享的 HTTP 客户端 (连接复用，并限制同时下载的数量)"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop or _client.is_closed:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=config.COVER_FETCH_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=config.COVER_MAX_CONNECTIONS),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close():
+    """关闭共享的 HTTP 客户端"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+async def _download(url: str, local_filepath: str) -> bool:
+    host = urlsplit(url).hostname or ""
+    try:
+        response = await _get_client().get(url)
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        # 主机可以正常响应，只是该 URL 无效 (如 404)
+        _host_failures.pop(host, None)
+        _record_failure(_url_failures, url)
+        print(f"图片缓存失败: {url}, 错误: {e}")
+        return False
+    except httpx.TransportError as e:
+        # 连接失败或超时，连续多次后整个主机都会暂时跳过
+        _record_failure(_url_failures, url)
+        _record_failure(_host_failures, host, config.COVER_HOST_FAILURE_THRESHOLD)
+        print(f"图片缓存失败: {url}, 错误: {e!r}")
+        return False
+
+    # 先写入临时文件再重命名，避免其他请求读到不完整的文件
+    tmp_filepath = f"{local_filepath}.{uuid.uuid4().hex}.tmp"
+    try:
+        async with await anyio.open_file(tmp_filepath, "wb") as f:
+            await f.write(response.content)
+        os.replace(tmp_filepath, local_filepath)
+    finally:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+
+    _url_failures.pop(url, None)
+    _host_failures.pop(host, None)
+    return True
+
+
+async def cache_image(url: str):
+    """下载并缓存封面，返回本地访问路径；失败或处于退避期时返回 None"""
+    if not is_remote_url(url):
+        return None
+    try:
+        url_hash = hashlib.sha256(url.encode()).hexdigest()
+        file_ext = os.path.splitext(url)[1] or ".jpg"
+        local_filename = f"{url_hash}{file_ext}"
+        local_filepath = os.path.join(config.CACHE_DIR, local_filename)
+        if os.path.exists(local_filepath):
+            return f"/cache/comic_cover/{local_filename}"
+
+        if _in_backoff(_url_failures, url) or _in_backoff(_host_failures, urlsplit(url).hostname or ""):
+            return None
+
+        task = _inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(_download(url, local_filepath))
+            _inflight[url] = task
+            task.add_done_callback(lambda _: _inflight.pop(url, None))
+        # shield: 某个调用者被取消时不影响其他等待同一下载的调用者
+        if await asyncio.shield(task):
+            return f"/cache/comic_cover/{local_filename}"
+        return None
+    except Exception as e:
+        print(f"图片缓存失败: {url}, 错误: {e}")
+        return None
+
+
+def get_failure_stats() -> dict:
+    """当前处于退避期的 URL 和主机数量"""
+    now = time.monotonic()
+    return {
+        "urls": sum(1 for _, retry_at in _url_failures.values() if retry_at > now),
+        "hosts": sum(1 for _, retry_at in _host_failures.values() if retry_at > now),
+    }
@@ -1,6 +1,9 @@
 # 导入所需的库
+import secrets
 from fastapi import Request, HTTPException, status, WebSocket
 
+from app import config
+
 # 检查用户是否已登录的依赖项 (用于 HTTP 请求)
 def get_current_user(request: Request):
     # 从 cookie 中获取会话 ID
@@ -23,3 +26,19 @@ async def get_current_user_ws(websocket: WebSocket):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return None
     return session
+
+# 检查订阅源请求的认证 (已登录的会话，或与 FEED_TOKEN 一致的令牌)
+# 订阅源多由阅读器和脚本访问，认证失败时返回 401 而不是重定向到登录页面
+def get_feed_user(request: Request, token: str = None):
+    if request.cookies.get("session"):
+        return "session"
+    # 令牌可以放在查询参数 ?token= 中，也可以使用 Authorization: Bearer <令牌>
+    authorization = request.headers.get("authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[len("bearer "):].strip()
+    if config.FEED_TOKEN and token and secrets.compare_digest(token, config.FEED_TOKEN):
+        return "token"
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
@@ -0,0 +1,121 @@
+# 导入所需的库
+import json
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from html import escape
+
+from app import config
+from app.services import parse_comic_update_time
+
+# --- 更新订阅源 (Atom / JSON Feed) ---
+#
+# 由 run_update_flow 产生的“最近更新”列表生成。渲染结果由 http_cache 按数据文件的版本缓存，
+# 数据没有变化时所有请求共用同一份字节 (以及压缩后的版本)。
+# 链接的前缀取自 FEED_BASE_URL，而不是请求的 Host 头，未设置时使用站内的相对链接。
+
+ATOM_NS = "http://www.w3.org/2005/Atom"
+# 订阅源中最多包含的条目数量
+MAX_ITEMS = 50
+
+ET.register_namespace("", ATOM_NS)
+
+
+def _entry_time(comic: dict) -> datetime:
+    """条目的更新时间: 优先使用漫画的更新时间，无法解析时使用获取时间"""
+    if comic.get("updateTimestamp") is not None:
+        return datetime.fromtimestamp(comic["updateTimestamp"], timezone.utc)
+    # 旧数据中没有时间戳的记录，直接解析 updateTime (不带时区时按本地时间处理，与 updateTimestamp 一致)
+    parsed = parse_comic_update_time(comic.get("updateTime"))
+    if parsed:
+        return datetime.fromtimestamp(parsed.timestamp(), timezone.utc)
+    fetched = comic.get("lastSuccessfulFetchTime")
+    if fetched:
+        try:
+            return datetime.strptime(fetched, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(0, timezone.utc)
+
+
+def _entry_id(profile_name: str, comic: dict) -> str:
+    # 包含更新时间，漫画每次更新都会成为阅读器中的新条目
+    return f"urn:venera:{profile_name}:{comic['id']}:{comic.get('updateTime') or ''}"
+
+
+def _absolute(url: str) -> str:
+    if not url or url.startswith(("http://", "https://")):
+        return url
+    return config.FEED_BASE_URL.rstrip("/") + "/" + url.lstrip("/")
+
+
+def _items(comics_data: dict) -> list:
+    return comics_data.get("updated_comics", [])[:MAX_ITEMS]
+
+
+def _feed_time(comics_data: dict, items: list) -> datetime:
+    if items:
+        return max(_entry_time(c) for c in items)
+    try:
+        return datetime.strptime(comics_data.get("last_updated", ""), "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return datetime.fromtimestamp(0, timezone.utc)
+
+
+def render_atom(comics_data: dict, profile_name: str) -> bytes:
+    """生成 Atom 订阅源"""
+    items = _items(comics_data)
+    home_url = _absolute(f"/?profile={profile_name}")
+
+    feed = ET.Element(f"{{{ATOM_NS}}}feed")
+    ET.SubElement(feed, f"{{{ATOM_NS}}}id").text = f"urn:venera:{profile_name}"
+    ET.SubElement(feed, f"{{{ATOM_NS}}}title").text = f"Venera 订阅更新 ({profile_name})"
+    ET.SubElement(feed, f"{{{ATOM_NS}}}updated").text = _feed_time(comics_data, items).isoformat()
+    ET.SubElement(feed, f"{{{ATOM_NS}}}link", href=home_url)
+
+    for comic in items:
+        entry = ET.SubElement(feed, f"{{{ATOM_NS}}}entry")
+        ET.SubElement(entry, f"{{{ATOM_NS}}}id").text = _entry_id(profile_name, comic)
+        ET.SubElement(entry, f"{{{ATOM_NS}}}title").text = f"《{comic.get('name', '')}》 更新啦"
+        ET.SubElement(entry, f"{{{ATOM_NS}}}updated").text = _entry_time(comic).isoformat()
+        ET.SubElement(entry, f"{{{ATOM_NS}}}link", href=home_url)
+        author = ET.SubElement(entry, f"{{{ATOM_NS}}}author")
+        ET.SubElement(author, f"{{{ATOM_NS}}}name").text = comic.get("author") or "N/A"
+        for tag in comic.get("tags") or []:
+            ET.SubElement(entry, f"{{{ATOM_NS}}}category", term=str(tag))
+
+        cover_url = _absolute(comic.get("coverUrl"))
+        summary = f"{comic.get('name', '')} - {comic.get('author') or 'N/A'} ({comic.get('updateTime') or '未知'})"
+        html = f'<img src="{escape(cover_url)}" alt="封面"><p>{escape(summary)}</p>' if cover_url else f"<p>{escape(summary)}</p>"
+        ET.SubElement(entry, f"{{{ATOM_NS}}}content", type="html").text = html
+
+    return ET.tostring(feed, encoding="utf-8", xml_declaration=True)
+
+
+def render_json_feed(comics_data: dict, profile_name: str) -> bytes:
+    """生成 JSON Feed (https://jsonfeed.org/version/1.1)"""
+    home_url = _absolute(f"/?profile={profile_name}")
+    items = []
+    for comic in _items(comics_data):
+        item = {
+            "id": _entry_id(profile_name, comic),
+            "url": home_url,
+            "title": f"《{comic.get('name', '')}》 更新啦",
+            "content_text": f"{comic.get('name', '')} - {comic.get('author') or 'N/A'} ({comic.get('updateTime') or '未知'})",
+            "date_modified": _entry_time(comic).isoformat(),
+            "authors": [{"name": comic.get("author") or "N/A"}],
+            "tags": comic.get("tags") or [],
+            # 自定义字段，方便脚本直接使用原始数据
+            "_venera": {"id": comic["id"], "type": comic.get("type"), "updateTime": comic.get("updateTime")},
+        }
+        cover_url = _absolute(comic.get("coverUrl"))
+        if cover_url:
+            item["image"] = cover_url
+        items.append(item)
+
+    feed = {
+        "version": "https://jsonfeed.org/version/1.1",
+        "title": f"Venera 订阅更新 ({profile_name})",
+        "home_page_url": home_url,
+        "items": items,
+    }
+    return json.dumps(feed, ensure_ascii=False).encode("utf-8")
@@ -0,0 +1,186 @@
+# 导入所需的库
+import gzip
+import hashlib
+import mimetypes
+import os
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.responses import Response, FileResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只提供 gzip 压缩
+    brotli = None
+
+from app import config
+
+# --- HTTP 缓存与预压缩 ---
+#
+# 封面文件名是 URL 的哈希，写入后内容不会再变化，可以让浏览器永久缓存；
+# 静态资源在启动时读入内存并预先压缩，请求时直接返回对应的版本；
+# 数据集接口的响应按数据文件 (data.json) 的版本缓存，同一版本只序列化和压缩一次，
+# 客户端可以通过 If-None-Match 继续使用已有的副本。
+
+COVER_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 值得压缩的内容类型
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml",
+                      "application/atom+xml", "application/feed+json", "image/svg+xml")
+# 超过该大小的静态文件不读入内存，按普通方式提供
+MAX_PRELOAD_BYTES = 1024 * 1024
+
+
+def _accepted_encodings(request_headers: Headers) -> set:
+    """客户端接受的压缩方式 (忽略权重，只排除 q=0)"""
+    accepted = set()
+    for part in request_headers.get("accept-encoding", "").split(","):
+        name, *params = part.split(";")
+        refused = False
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    refused = float(value) == 0
+                except ValueError:
+                    pass
+        if not refused:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _etag_matches(request_headers: Headers, etags: set) -> bool:
+    value = request_headers.get("if-none-match")
+    if not value:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in value.split(",")}
+    return "*" in candidates or not candidates.isdisjoint(etags)
+
+
+def _not_modified_since(request_headers: Headers, last_modified: float) -> bool:
+    # 同时带有 If-None-Match 时以 ETag 为准
+    value = request_headers.get("if-modified-since")
+    if not value or "if-none-match" in request_headers:
+        return False
+    try:
+        return int(last_modified) <= parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+class CompressedBody:
+    """一份响应内容以及预先压缩好的 gzip / brotli 版本"""
+
+    def __init__(self, body: bytes, media_type: str, last_modified: float = None):
+        self.media_type = media_type
+        self.last_modified = last_modified or time.time()
+        self.digest = hashlib.sha1(body).hexdigest()[:20]
+        # 压缩方式 (None 表示不压缩) -> (内容, ETag)
+        self.variants = {None: (body, f'"{self.digest}"')}
+        if len(body) >= config.COMPRESS_MIN_BYTES and media_type.startswith(COMPRESSIBLE_TYPES):
+            self._add_variant("gzip", gzip.compress(body, compresslevel=9, mtime=0))
+            if brotli:
+                self._add_variant("br", brotli.compress(body))
+
+    def _add_variant(self, encoding: str, data: bytes):
+        if len(data) < len(self.variants[None][0]):
+            self.variants[encoding] = (data, f'"{self.digest}-{encoding}"')
+
+    def response(self, request_headers: Headers, cache_control: str) -> Response:
+        """根据请求头选择压缩版本，内容未变化时返回 304"""
+        accepted = _accepted_encodings(request_headers)
+        encoding = next((e for e in ("br", "gzip") if e in self.variants and e in accepted), None)
+        body, etag = self.variants[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": cache_control,
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+        }
+        if len(self.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+
+        all_etags = {tag for _, tag in self.variants.values()}
+        if _etag_matches(request_headers, all_etags) or _not_modified_since(request_headers, self.last_modified):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=self.media_type, headers=headers)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """启动时将目录中的文件读入内存并预先压缩，请求时不再读取磁盘或压缩"""
+
+    def __init__(self, directory: str):
+        super().__init__(directory=directory)
+        self._assets = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                if os.path.getsize(full_path) > MAX_PRELOAD_BYTES:
+                    continue
+                with open(full_path, "rb") as f:
+                    body = f.read()
+                media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                self._assets[os.path.relpath(full_path, directory)] = CompressedBody(
+                    body, media_type, os.path.getmtime(full_path))
+        print(f"已预压缩 '{directory}' 中的 {len(self._assets)} 个静态文件 (brotli: {'可用' if brotli else '未安装'})。")
+
+    async def get_response(self, path: str, scope) -> Response:
+        asset = self._assets.get(path)
+        if asset is None or scope["method"] not in ("GET", "HEAD"):
+            # 启动后新增的文件和过大的文件按普通方式提供
+            return await super().get_response(path, scope)
+        if config.STATIC_CACHE_SECONDS > 0:
+            cache_control = f"public, max-age={config.STATIC_CACHE_SECONDS}"
+        else:
+            cache_control = "public, no-cache"
+        return asset.response(Headers(scope=scope), cache_control)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """文件名即内容标识的目录 (封面缓存): 允许永久缓存，并以文件名作为强 ETag"""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        response.headers["etag"] = f'"{os.path.splitext(os.path.basename(full_path))[0]}"'
+        response.headers["cache-control"] = COVER_CACHE_CONTROL
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+# --- 数据集响应缓存 ---
+
+# (名称, 数据文件) -> (数据版本, CompressedBody)
+_rendered = {}
+
+
+def dataset_version(data_file: str) -> str:
+    """数据文件的版本标识，文件被重写后改变 (多个进程之间同样有效)"""
+    try:
+        stat_result = os.stat(data_file)
+    except FileNotFoundError:
+        return "missing"
+    return f"{stat_result.st_mtime_ns}-{stat_result.st_size}"
+
+
+def render_cached(name: str, data_file: str, render) -> CompressedBody:
+    """按数据版本缓存渲染结果。render() 返回 (内容, 内容类型)，只有数据文件变化后才会重新调用"""
+    # 先取版本再渲染: 渲染期间数据被改写时，下次请求会因版本不同而重新渲染
+    version = dataset_version(data_file)
+    cached = _rendered.get((name, data_file))
+    if cached and cached[0] == version:
+        return cached[1]
+    body, media_type = render()
+    last_modified = os.path.getmtime(data_file) if version != "missing" else None
+    entry = CompressedBody(body, media_type, last_modified)
+    _rendered[(name, data_file)] = (version, entry)
+    return entry
+
+
+def dataset_response(request: Request, name: str, data_file: str, render) -> Response:
+    """返回按数据版本缓存的响应，支持 If-None-Match / If-Modified-Since"""
+    return render_cached(name, data_file, render).response(request.headers, "private, no-cache")
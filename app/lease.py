@@ -0,0 +1,151 @@
+# 导入所需的库
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台只能单进程运行，不做文件锁
+    fcntl = None
+
+from app import config
+
+# --- 跨进程租约 ---
+#
+# 租约文件中记录当前持有者和过期时间。读写租约文件时使用 flock 保证原子性，
+# 持有者通过心跳不断延长过期时间；持有者退出或卡死时，租约过期后即可被其他进程接管。
+# 过期机制也让它在 flock 不可靠的共享存储上仍能工作。
+
+
+class FileLease:
+    """基于租约文件的跨进程锁 (只对持有它的任务可重入)"""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._depth = 0
+        self._heartbeat = None
+        # 本进程中持有 (或正在获取) 租约的任务；同一进程的其他任务同样不能获取
+        self._owner_task = None
+
+    @property
+    def held(self) -> bool:
+        return self._depth > 0
+
+    def _update(self, mode: str) -> bool:
+        """在文件锁保护下读取并更新租约。mode: take (获取)、renew (续约)、release (释放)、peek (查询是否可获取)"""
+        with open(self.path, "a+", encoding="utf-8") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    current = json.loads(f.read() or "{}")
+                except ValueError:
+                    current = {}
+                now = time.time()
+                mine = current.get("owner") == self.owner
+                free = not current.get("owner") or current.get("expires", 0) < now
+
+                if mode == "peek":
+                    return mine or free
+                if mode == "release":
+                    record = {} if mine else None
+                elif mine or (mode == "take" and free):
+                    record = {"owner": self.owner, "expires": now + self.ttl}
+                else:
+                    record = None
+
+                if record is None:
+                    return False
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(record))
+                f.flush()
+                return True
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    async def _call(self, mode: str) -> bool:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._update, mode)
+
+    async def acquire(self) -> bool:
+        """尝试获取租约，成功后在后台定期续约；同一任务已持有时只增加计数，
+        本进程的其他任务持有时与其他进程持有时一样直接返回 False"""
+        current = asyncio.current_task()
+        if self._owner_task is not None:
+            if self._owner_task is not current or not self._depth:
+                return False
+            self._depth += 1
+            return True
+        # 在等待租约文件之前占位，避免本进程的其他任务同时获取
+        self._owner_task = current
+        try:
+            taken = await self._call("take")
+        except OSError as e:
+            print(f"获取租约 '{self.path}' 失败: {e}")
+            taken = False
+        if not taken:
+            self._owner_task = None
+            return False
+        self._depth = 1
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        return True
+
+    async def release(self):
+        """释放一次租约，计数归零时真正释放"""
+        if not self._depth:
+            return
+        self._depth -= 1
+        if self._depth:
+            return
+        self._owner_task = None
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        try:
+            await self._call("release")
+        except OSError as e:
+            print(f"释放租约 '{self.path}' 失败: {e}")
+
+    async def is_free(self) -> bool:
+        """租约当前是否空闲 (本进程和其他进程都没有持有，或其他进程的租约已过期)"""
+        if self._owner_task is not None:
+            return False
+        try:
+            return await self._call("peek")
+        except OSError:
+            return True
+
+    async def _heartbeat_loop(self):
+        while self._depth:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                renewed = await self._call("renew")
+            except OSError as e:
+                print(f"租约 '{self.path}' 续约失败: {e}")
+                continue
+            if not renewed:
+                print(f"警告: 租约 '{self.path}' 已被其他进程接管。")
+                self._depth = 0
+                self._owner_task = None
+                self._heartbeat = None
+                return
+
+
+# 调度主节点: 只有持有该租约的进程会执行定时更新
+leader_lease = FileLease(os.path.join(config.LEASE_DIR, "scheduler.lease"), config.LEASE_TTL_SECONDS)
+
+
+async def run_leader_election():
+    """持续参与调度主节点选举，主节点退出后其他进程会在租约过期后接管"""
+    while True:
+        if not leader_lease.held and await leader_lease.acquire():
+            print(f"本进程 ({leader_lease.owner}) 已成为定时更新的主节点。")
+        await asyncio.sleep(leader_lease.ttl / 2)
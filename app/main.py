@@ -5,11 +5,12 @@ import tempfile
 import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 # 导入本地模块
-from app import routers, config, services
+from app import routers, config, services, covers, lease, http_cache, profiles
+from app.bus import bus
 
 # --- 全局变量 ---
 # 用于存储 venera 可执行文件的临时路径
@@ -37,28 +38,44 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"复制 '{source_dir}' 失败: {e}")
         # 如果复制失败，则回退到使用本地路径
-        VENERA_TMP_PATH = os.path.join(source_dir, "venera")
+        VENERA_TMP_PATH = os.path.abspath(os.path.join(source_dir, "venera"))
 
-    # 2. 启动后台定时更新任务
+    # 2. 连接事件总线 (多 worker 时会先同步其他进程中正在运行的流程状态)
+    await bus.start()
+    print(f"事件总线已启动: {type(bus).__name__}")
+
+    # 3. 为每个 profile 准备目录并根据已有数据建立搜索索引
+    for profile in profiles.profiles.values():
+        profile.ensure_dirs()
+        profile.index.rebuild(services.load_data(profile).get("all_comics", []))
+        print(f"profile '{profile.name}' 的搜索索引已建立，共 {len(profile.index)} 部漫画。")
+
+    # 4. 启动后台定时更新任务 (多个进程中只有选举出的主节点会执行)
     async def periodic_update():
         while True:
             await asyncio.sleep(config.UPDATE_INTERVAL_MINUTES * 60)
-            print(f"开始执行定时更新任务 (间隔: {config.UPDATE_INTERVAL_MINUTES} 分钟)...")
-            try:
-                await services.run_update_flow()
-                print("定时更新任务执行完毕。")
-            except Exception as e:
-                print(f"定时更新任务执行失败: {e}")
+            if not lease.leader_lease.held:
+                continue
+            # 通过队列执行，与手动请求的完整更新合并；各 profile 的流程并行运行
+            for profile in profiles.profiles.values():
+                ticket = await services.enqueue_full_update(profile)
+                print(f"profile '{profile.name}' 的定时更新任务已加入队列 "
+                      f"(间隔: {config.UPDATE_INTERVAL_MINUTES} 分钟, 票据: {ticket['ticket']})。")
 
     background_task = asyncio.create_task(periodic_update())
+    election_task = asyncio.create_task(lease.run_leader_election())
     print(f"后台定时更新任务已启动，每 {config.UPDATE_INTERVAL_MINUTES} 分钟检查一次。")
 
     yield # 应用运行
 
     print("应用关闭中...")
-    # 3. 清理后台任务和临时文件
+    # 5. 清理后台任务和临时文件
     if background_task:
         background_task.cancel()
+    election_task.cancel()
+    await lease.leader_lease.release()
+    await covers.close()
+    await bus.stop()
     if os.path.exists(temp_dir):
         shutil.rmtree(temp_dir)
         print(f"临时目录 '{temp_dir}' 已清理。")
@@ -74,6 +91,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 超过一定大小的 HTML / JSON 响应使用 gzip 压缩 (已预先压缩的响应和图片会被跳过)
+app.add_middleware(GZipMiddleware, minimum_size=config.COMPRESS_MIN_BYTES)
 
 # --- 路由 ---
 app.include_router(routers.router)
@@ -82,8 +101,9 @@ app.include_router(routers.router)
 # 在挂载前确保目录存在
 os.makedirs("static", exist_ok=True)
 os.makedirs("cache", exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/cache", StaticFiles(directory="cache"), name="cache")
+# 静态资源启动时预压缩；封面文件名为 URL 的哈希，可以永久缓存
+app.mount("/static", http_cache.PrecompressedStaticFiles("static"), name="static")
+app.mount("/cache", http_cache.ImmutableStaticFiles(directory="cache"), name="cache")
 
 # --- 辅助函数 ---
 def get_venera_executable_path() -> str:
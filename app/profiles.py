@@ -0,0 +1,92 @@
+# 导入所需的库
+import json
+import os
+import re
+
+from app import config, lease, search
+
+# --- 多账号 (profile) ---
+#
+# 每个 profile 对应一套独立的 venera 数据目录 (其中保存了 WebDAV 账号和订阅列表)、
+# 数据文件和收件人，并拥有各自的流程锁和搜索索引；所有 profile 共用同一份 venera 运行时副本。
+# 没有 profiles 配置文件时只有一个 default profile，行为与单账号时完全相同。
+
+DEFAULT_PROFILE = "default"
+_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class Profile:
+    """一个 venera 账号的配置，以及它的流程锁和搜索索引"""
+
+    def __init__(self, name: str, venera_home: str = None, data_file: str = None, mail_recipient: str = None):
+        self.name = name
+        # venera 数据目录: 作为子进程的 HOME、XDG 目录和工作目录；None 表示沿用当前环境
+        self.venera_home = os.path.abspath(venera_home) if venera_home else None
+        if data_file:
+            self.data_file = data_file
+        else:
+            self.data_file = config.DATA_FILE if name == DEFAULT_PROFILE else f"data-{name}.json"
+        # 检查记录: 与数据文件放在一起 (data.json -> data.checked.json)
+        self.check_file = os.path.splitext(self.data_file)[0] + ".checked.json"
+        self._mail_recipient = mail_recipient
+        # default profile 沿用原来的锁文件名，便于从单账号平滑升级
+        lease_name = "flow.lease" if name == DEFAULT_PROFILE else f"flow-{name}.lease"
+        self.flow_lease = lease.FileLease(os.path.join(config.LEASE_DIR, lease_name), config.LEASE_TTL_SECONDS)
+        self.index = search.SearchIndex()
+
+    @property
+    def mail_recipient(self) -> str:
+        # 未单独配置时使用设置页面中的收件人
+        return self._mail_recipient or config.MAIL_RECIPIENT
+
+    def ensure_dirs(self):
+        """创建 venera 数据目录和数据文件所在的目录"""
+        if self.venera_home:
+            os.makedirs(self.venera_home, exist_ok=True)
+        data_dir = os.path.dirname(self.data_file)
+        if data_dir:
+            os.makedirs(data_dir, exist_ok=True)
+
+    def subprocess_env(self):
+        """venera 子进程的环境变量，让它在自己的数据目录中读写配置"""
+        if not self.venera_home:
+            return None
+        env = dict(os.environ)
+        env.update({
+            "HOME": self.venera_home,
+            "XDG_DATA_HOME": os.path.join(self.venera_home, ".local", "share"),
+            "XDG_CONFIG_HOME": os.path.join(self.venera_home, ".config"),
+            "XDG_CACHE_HOME": os.path.join(self.venera_home, ".cache"),
+        })
+        return env
+
+
+def load_profiles() -> dict:
+    """读取 profiles 配置文件，返回 名称 -> Profile (保持配置中的顺序)"""
+    if not os.path.exists(config.PROFILES_FILE):
+        return {DEFAULT_PROFILE: Profile(DEFAULT_PROFILE)}
+
+    with open(config.PROFILES_FILE, "r", encoding="utf-8") as f:
+        entries = json.load(f).get("profiles", [])
+    loaded = {}
+    for entry in entries:
+        name = entry.get("name", "")
+        if not _NAME_RE.match(name):
+            raise ValueError(f"profile 名称 '{name}' 无效，只能包含字母、数字、下划线和连字符。")
+        if name in loaded:
+            raise ValueError(f"profile '{name}' 重复定义。")
+        loaded[name] = Profile(name, entry.get("venera_home"), entry.get("data_file"), entry.get("mail_recipient"))
+    if not loaded:
+        raise ValueError(f"'{config.PROFILES_FILE}' 中没有定义任何 profile。")
+    return loaded
+
+
+# 所有 profile，第一个为默认 profile
+profiles = load_profiles()
+
+
+def get_profile(name: str = None) -> Profile:
+    """按名称获取 profile，name 为空时返回默认 profile；不存在时抛出 KeyError"""
+    if not name:
+        return next(iter(profiles.values()))
+    return profiles[name]
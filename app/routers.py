@@ -1,20 +1,44 @@
 # 导入所需的库
 import asyncio
+import json
+from collections import OrderedDict
 from fastapi import APIRouter, Request, Form, HTTPException, WebSocket, WebSocketDisconnect, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
 # 导入本地模块
-from app import services, config, state
-from app.dependencies import get_current_user, get_current_user_ws
+from app import services, config, state, capture, http_cache, profiles, feeds
+from app.dependencies import get_current_user, get_current_user_ws, get_feed_user
 from app.models import MailSettings, AdvancedSettings
-from app.websocket import manager
+from app.websocket import manager, is_valid_topic
 
 # 创建一个 FastAPI 路由器实例
 router = APIRouter()
 # 指定模板文件所在的目录
 templates = Jinja2Templates(directory="templates")
 
+# 根据查询参数 ?profile= 获取 profile，未指定时使用默认 profile
+def get_request_profile(profile: str = None) -> profiles.Profile:
+    try:
+        return profiles.get_profile(profile)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown profile '{profile}'.")
+
+# 如果本进程或其他进程中已有该 profile 的更新流程在运行，则返回 409
+async def ensure_no_running_flow(profile: profiles.Profile):
+    current_state = state.get_current_state(profile.name)
+    if current_state["flows"] or not await profile.flow_lease.is_free():
+        raise HTTPException(status_code=409, detail="An update process is already running.")
+
+def ticket_response(ticket: dict) -> dict:
+    return {
+        "status": ticket["status"],
+        "ticket": ticket["ticket"],
+        "kind": ticket["kind"],
+        "profile": ticket["profile"],
+        "duplicate": ticket.get("duplicate", False),
+    }
+
 # --- 认证路由 ---
 
 # 登录页面
@@ -48,11 +72,15 @@ async def logout():
 
 # 根路由，用于显示主页
 @router.get("/", response_class=HTMLResponse)
-async def read_root(request: Request, user: str = Depends(get_current_user)):
-    # 加载漫画数据
-    comics_data = services.load_data()
+async def read_root(request: Request, user: str = Depends(get_current_user),
+                    profile: profiles.Profile = Depends(get_request_profile)):
+    # 加载该 profile 的漫画数据
+    comics_data = services.load_data(profile)
     # 渲染主页模板并返回
-    return templates.TemplateResponse("index.html", {"request": request, "comics_data": comics_data})
+    return templates.TemplateResponse("index.html", {
+        "request": request, "comics_data": comics_data, "check_status": services.load_check_status(profile),
+        "profile": profile.name, "profiles": list(profiles.profiles),
+    })
 
 # 设置页面路由
 @router.get("/settings", response_class=HTMLResponse)
@@ -126,56 +154,131 @@ async def update_advanced_settings(settings: AdvancedSettings):
     config.COMMAND_TIMEOUT_SECONDS = settings.command_timeout
     return {"message": "Advanced settings updated successfully. Please restart the application for the update interval to take effect."}
 
-# 触发更新流程
+# 触发更新流程 (正在运行其他流程时加入队列)
 @router.post("/update", dependencies=[Depends(get_current_user)])
-async def update_subscriptions():
-    current_state = state.get_current_state()
-    if current_state["flows"]:
-        raise HTTPException(status_code=409, detail="An update process is already running.")
-    # 异步执行更新流程
-    asyncio.create_task(services.run_update_flow())
-    # 返回状态信息
-    return {"status": "Update process started."}
+async def update_subscriptions(profile: profiles.Profile = Depends(get_request_profile)):
+    ticket = await services.enqueue_full_update(profile)
+    return ticket_response(ticket)
 
-# 触发单个漫画的更新流程
+# 触发单个漫画的更新流程 (正在运行其他流程时加入队列)
 @router.post("/update_single/{comic_type}/{comic_id}", dependencies=[Depends(get_current_user)])
-async def update_single_subscription(comic_type: str, comic_id: str):
-    current_state = state.get_current_state()
-    if current_state["flows"]:
-        raise HTTPException(status_code=409, detail="An update process is already running.")
-    
-    # 异步执行单个漫画的更新流程
-    asyncio.create_task(services.run_single_update_flow(comic_id, comic_type))
-    return {"status": f"Update process for comic {comic_id} started."}
+async def update_single_subscription(comic_type: str, comic_id: str,
+                                     profile: profiles.Profile = Depends(get_request_profile)):
+    ticket = await services.enqueue_single_update(comic_id, comic_type, profile)
+    return ticket_response(ticket)
+
+# 获取完整的漫画数据 (按 data.json 的版本缓存，支持 If-None-Match)
+@router.get("/api/comics", dependencies=[Depends(get_current_user)])
+async def get_comics(request: Request, profile: profiles.Profile = Depends(get_request_profile)):
+    def render():
+        return json.dumps(services.load_data(profile), ensure_ascii=False).encode("utf-8"), "application/json"
+    return http_cache.dataset_response(request, "comics", profile.data_file, render)
+
+# 更新订阅源 (Atom / JSON Feed)，每个数据版本只渲染一次，支持 If-None-Match / If-Modified-Since
+@router.get("/feeds/atom.xml", dependencies=[Depends(get_feed_user)])
+async def atom_feed(request: Request, profile: profiles.Profile = Depends(get_request_profile)):
+    def render():
+        return feeds.render_atom(services.load_data(profile), profile.name), "application/atom+xml"
+    return http_cache.dataset_response(request, "atom", profile.data_file, render)
+
+@router.get("/feeds/feed.json", dependencies=[Depends(get_feed_user)])
+async def json_feed(request: Request, profile: profiles.Profile = Depends(get_request_profile)):
+    def render():
+        return feeds.render_json_feed(services.load_data(profile), profile.name), "application/feed+json"
+    return http_cache.dataset_response(request, "json_feed", profile.data_file, render)
+
+# 搜索漫画 (名称、作者、标签和来源)
+@router.get("/api/search", dependencies=[Depends(get_current_user)])
+async def search_comics(q: str = "", limit: int = 20, profile: profiles.Profile = Depends(get_request_profile)):
+    if not profile.index.built:
+        profile.index.rebuild(services.load_data(profile).get("all_comics", []))
+    return profile.index.search(q, max(1, min(limit, 100)))
+
+# 列出所有录制文件
+@router.get("/captures", dependencies=[Depends(get_current_user)])
+async def list_captures():
+    return {"captures": capture.list_captures()}
+
+# 回放录制文件，重新执行解析、合并和通知流程
+@router.post("/replay/{capture_name}", dependencies=[Depends(get_current_user)])
+async def replay_capture(capture_name: str, pacing: str = "fast", send_email: bool = False):
+    if pacing not in ("fast", "original"):
+        raise HTTPException(status_code=400, detail="pacing must be 'fast' or 'original'.")
+    try:
+        path = capture.get_capture_path(capture_name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Capture not found.")
+    # 回放到录制时的 profile
+    await ensure_no_running_flow(get_request_profile(capture.read_header(path).get("args", {}).get("profile")))
+    asyncio.create_task(services.replay_capture(path, pacing, send_email))
+    return {"status": f"Replay of {capture_name} started."}
 
 # 取消更新流程
 @router.post("/cancel_update/{flow_id}", dependencies=[Depends(get_current_user)])
 async def cancel_update(flow_id: str):
-    state.cancel_flow(flow_id)
+    await state.cancel_flow(flow_id)
     return {"status": f"Cancellation request for flow {flow_id} received."}
 
 # --- WebSocket ---
 
-# WebSocket 端点，用于实时通信
+async def handle_ws_message(websocket: WebSocket, text: str):
+    try:
+        message = json.loads(text)
+        action = message.get("action")
+        topics = message.get("topics", [])
+    except (ValueError, AttributeError):
+        await websocket.send_text(json.dumps({"type": "error", "detail": "Invalid message."}))
+        return
+    if action not in ("subscribe", "unsubscribe") or not isinstance(topics, list) \
+            or not all(isinstance(t, str) and is_valid_topic(t) for t in topics):
+        await websocket.send_text(json.dumps({"type": "error", "detail": "Unknown action or topic."}))
+        return
+    if action == "subscribe":
+        subscribed = manager.subscribe(websocket, topics)
+    else:
+        subscribed = manager.unsubscribe(websocket, topics)
+    await websocket.send_text(json.dumps({"type": "subscribed", "topics": sorted(subscribed)}))
+
+def initial_state(websocket: WebSocket, profile: str) -> dict:
+    """新连接的初始状态，去掉该连接没有订阅的任务日志"""
+    from app.state import get_current_state
+    current_state = get_current_state(profile)
+    for flow in current_state["flows"].values():
+        flow["tasks"] = OrderedDict(
+            (task_id, task if manager.wants_logs(websocket, task_id) else dict(task, logs=[]))
+            for task_id, task in flow["tasks"].items())
+    return current_state
+
+# WebSocket 端点，用于实时通信 (只推送 ?profile= 指定的 profile 的消息)
+# ?topics=progress,data 可以在连接时直接订阅，初始状态也只包含订阅的内容
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, user: str = Depends(get_current_user_ws)):
+async def websocket_endpoint(websocket: WebSocket, user: str = Depends(get_current_user_ws), profile: str = None,
+                             topics: str = None):
     # 如果用户未通过认证，则直接返回
     if not user:
         return
+    if profile is not None and profile not in profiles.profiles:
+        await websocket.close(code=4404)
+        return
+    profile = profiles.get_profile(profile).name
+    initial_topics = [t for t in topics.split(",") if t] if topics is not None else None
+    if initial_topics is not None and not all(is_valid_topic(t) for t in initial_topics):
+        await websocket.close(code=4400)
+        return
     
     # 接受 WebSocket 连接
-    await manager.connect(websocket)
+    await manager.connect(websocket, profile)
+    if initial_topics is not None:
+        manager.subscribe(websocket, initial_topics)
     
-    # 导入并获取当前状态
-    from app.state import get_current_state
-    import json
     # 将当前状态发送给新连接的客户端
-    await websocket.send_text(json.dumps(get_current_state()))
+    await websocket.send_text(json.dumps(initial_state(websocket, profile)))
     
     try:
-        # 保持连接，等待客户端消息
+        # 保持连接，处理客户端的订阅消息:
+        # {"action": "subscribe" | "unsubscribe", "topics": ["progress", "data", "logs:<taskId>", "logs:*"]}
         while True:
-            await websocket.receive_text()
+            await handle_ws_message(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
         # 如果连接断开，则从管理器中移除
         manager.disconnect(websocket)
@@ -0,0 +1,192 @@
+# 导入所需的库
+import bisect
+import math
+import re
+import time
+from collections import defaultdict
+
+# --- 全文搜索索引 ---
+
+# 各字段的权重，名称命中比标签命中更重要
+FIELD_WEIGHTS = {"name": 3.0, "author": 2.0, "tags": 1.5, "type": 1.0}
+# 前缀匹配的得分折扣，以及单个查询词最多展开的前缀词数量
+PREFIX_DISCOUNT = 0.5
+MAX_PREFIX_EXPANSIONS = 200
+
+# 中日韩字符范围，这些文字没有空格分词，使用单字和二元组 (n-gram) 建立索引
+_CJK = "\u2e80-\u2fff\u3040-\u30ff\u3100-\u31ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_CJK_RE = re.compile(f"[{_CJK}]")
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+
+
+def _is_cjk(term: str) -> bool:
+    return bool(_CJK_RE.match(term))
+
+
+def tokenize(text: str) -> list:
+    """将文本切分为索引词: 拉丁文字按单词切分，中日韩文字切分为单字和二元组"""
+    terms = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if _is_cjk(run):
+            terms.extend(run)
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return terms
+
+
+def tokenize_query(text: str) -> list:
+    """切分查询: 中日韩片段只使用二元组 (单个字时使用单字)，所有词都必须命中"""
+    terms = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if _is_cjk(run) and len(run) > 1:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    # 去重并保持顺序
+    return list(dict.fromkeys(terms))
+
+
+def _field_texts(comic: dict) -> dict:
+    return {
+        "name": comic.get("name") or "",
+        "author": comic.get("author") or "",
+        "tags": " ".join(comic.get("tags") or []),
+        "type": comic.get("type") or "",
+    }
+
+
+class SearchIndex:
+    """基于倒排表的漫画搜索索引，支持增量更新、前缀匹配和按相关度排序"""
+
+    def __init__(self):
+        self.built = False
+        # 索引词 -> {漫画ID: 权重}
+        self._postings = defaultdict(dict)
+        # 漫画ID -> {索引词: 权重}，用于删除和更新
+        self._doc_terms = {}
+        # 漫画ID -> 被索引字段的内容，内容未变时跳过重新分词
+        self._doc_fields = {}
+        # 漫画ID -> 漫画记录
+        self._docs = {}
+        # 有序的非中日韩索引词列表，用于前缀查找
+        self._vocab = []
+
+    def __len__(self):
+        return len(self._docs)
+
+    def rebuild(self, comics: list):
+        """根据漫画记录重新建立整个索引"""
+        self.__init__()
+        for comic in comics:
+            self.upsert(comic)
+        self.built = True
+
+    def sync(self, comics: list):
+        """将索引与给定的完整漫画列表同步，只重新索引有变化的条目"""
+        current_ids = set()
+        for comic in comics:
+            current_ids.add(comic["id"])
+            self.upsert(comic)
+        for comic_id in [i for i in self._docs if i not in current_ids]:
+            self.remove(comic_id)
+        self.built = True
+
+    def upsert(self, comic: dict):
+        """添加或更新一部漫画"""
+        comic_id = comic["id"]
+        fields = _field_texts(comic)
+        self._docs[comic_id] = comic
+        if self._doc_fields.get(comic_id) == fields:
+            return
+        self._remove_terms(comic_id)
+
+        weights = defaultdict(float)
+        for field, text in fields.items():
+            for term in tokenize(text):
+                weights[term] += FIELD_WEIGHTS[field]
+        for term, weight in weights.items():
+            if term not in self._postings and not _is_cjk(term):
+                bisect.insort(self._vocab, term)
+            self._postings[term][comic_id] = weight
+        self._doc_terms[comic_id] = dict(weights)
+        self._doc_fields[comic_id] = fields
+
+    def remove(self, comic_id: str):
+        """从索引中删除一部漫画"""
+        self._remove_terms(comic_id)
+        self._docs.pop(comic_id, None)
+        self._doc_fields.pop(comic_id, None)
+
+    def _remove_terms(self, comic_id: str):
+        for term in self._doc_terms.pop(comic_id, {}):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(comic_id, None)
+            if not postings:
+                del self._postings[term]
+                if not _is_cjk(term):
+                    position = bisect.bisect_left(self._vocab, term)
+                    if position < len(self._vocab) and self._vocab[position] == term:
+                        self._vocab.pop(position)
+
+    def _prefix_terms(self, prefix: str) -> list:
+        start = bisect.bisect_left(self._vocab, prefix)
+        terms = []
+        for term in self._vocab[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _idf(self, term: str) -> float:
+        return math.log(1 + len(self._docs) / (1 + len(self._postings.get(term, ()))))
+
+    def _match_term(self, term: str) -> dict:
+        """返回命中单个查询词的漫画及其得分"""
+        if _is_cjk(term):
+            return {comic_id: weight * self._idf(term) for comic_id, weight in self._postings.get(term, {}).items()}
+
+        scores = {}
+        for candidate in self._prefix_terms(term):
+            factor = 1.0 if candidate == term else PREFIX_DISCOUNT
+            idf = self._idf(candidate)
+            for comic_id, weight in self._postings[candidate].items():
+                score = weight * idf * factor
+                if score > scores.get(comic_id, 0.0):
+                    scores[comic_id] = score
+        return scores
+
+    def search(self, query: str, limit: int = 20) -> dict:
+        """搜索漫画，返回按相关度排序的结果"""
+        started = time.perf_counter()
+        terms = tokenize_query(query)
+        scores = None
+        # 先处理命中较少的词，尽早缩小候选集合
+        for matches in sorted((self._match_term(t) for t in terms), key=len):
+            if scores is None:
+                scores = matches
+            else:
+                scores = {i: s + matches[i] for i, s in scores.items() if i in matches}
+            if not scores:
+                break
+        scores = scores or {}
+
+        # 名称与查询完全一致或以查询开头的结果额外加分
+        normalized = query.strip().lower()
+        for comic_id in scores:
+            name = (self._docs[comic_id].get("name") or "").lower()
+            if name == normalized:
+                scores[comic_id] += 100.0
+            elif normalized and name.startswith(normalized):
+                scores[comic_id] += 10.0
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self._docs[item[0]].get("name") or ""))
+        return {
+            "query": query,
+            "total": len(ranked),
+            "took_ms": round((time.perf_counter() - started) * 1000, 3),
+            "results": [dict(self._docs[comic_id], score=round(score, 3)) for comic_id, score in ranked[:limit]],
+        }
+
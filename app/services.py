@@ -2,22 +2,25 @@ import asyncio
 import json
 import os
 import hashlib
-import httpx
-import anyio
 import uuid
 import smtplib
+import functools
 from datetime import datetime
 from typing import Union
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
 
-from app import state, config
-from app.websocket import manager  # Keep for data_updated broadcast
+from app import state, config, capture, profiles
+from app.profiles import Profile
+from app.covers import cache_image, is_remote_url, get_failure_stats
+from app.bus import bus
 
 # --- 日期解析辅助函数 ---
 
 
+# 同一个日期字符串在每次流程和邮件中都会反复出现，缓存解析结果 (datetime 不可变，可以安全共享)
+@functools.lru_cache(maxsize=8192)
 def parse_comic_update_time(time_str: str) -> Union[datetime, None]:
     """
     一个灵活的日期解析函数，尝试多种格式.
@@ -50,28 +53,159 @@ def parse_comic_update_time(time_str: str) -> Union[datetime, None]:
     print(f"警告: 无法解析日期字符串 '{time_str}'")
     return None
 
+
+def normalize_update_time(comic: dict) -> dict:
+    """在数据进入系统时将 updateTime 解析为时间戳并保存在记录中，无法解析时为 None"""
+    dt = parse_comic_update_time(comic.get('updateTime'))
+    # 不带时区的时间按本地时间处理，与之前转换为本地时间再比较的结果一致
+    comic['updateTimestamp'] = dt.timestamp() if dt else None
+    return comic
+
+
+def comic_sort_key(comic: dict) -> float:
+    """漫画的排序键，旧数据中没有时间戳的记录会在第一次使用时补上"""
+    if 'updateTimestamp' not in comic:
+        normalize_update_time(comic)
+    timestamp = comic['updateTimestamp']
+    # 将无法解析的日期排在最后
+    return timestamp if timestamp is not None else float('-inf')
+
+
+def ensure_sorted(comics: list):
+    """确保列表按更新时间从新到旧排列，已有序时只做一次线性检查"""
+    keys = [comic_sort_key(c) for c in comics]
+    if any(keys[i] < keys[i + 1] for i in range(len(keys) - 1)):
+        comics.sort(key=comic_sort_key, reverse=True)
+
+
+def insert_sorted(comics: list, comic: dict):
+    """二分查找插入位置，保持列表按更新时间从新到旧排列 (相同时间排在已有条目之后)"""
+    key = comic_sort_key(comic)
+    lo, hi = 0, len(comics)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if comic_sort_key(comics[mid]) >= key:
+            lo = mid + 1
+        else:
+            hi = mid
+    comics.insert(lo, comic)
+
+
+def merge_sorted(comics: list, new_comics: list):
+    """将 new_comics 合并进有序列表: 数量少时逐个二分插入，数量多时追加后整体排序"""
+    if len(new_comics) * 8 > len(comics):
+        comics.extend(new_comics)
+        comics.sort(key=comic_sort_key, reverse=True)
+    else:
+        for comic in new_comics:
+            insert_sorted(comics, comic)
+
+
+def replace_sorted(comics: list, old_comic: dict, new_comic: dict):
+    """用 new_comic 替换列表中的 old_comic，只有排序键变化时才移动位置"""
+    index = comics.index(old_comic)
+    if comic_sort_key(old_comic) == comic_sort_key(new_comic):
+        comics[index] = new_comic
+    else:
+        comics.pop(index)
+        insert_sorted(comics, new_comic)
+
+# --- 变化检测 ---
+
+
+def comic_fingerprint(comic: dict) -> str:
+    """根据 venera 返回的原始字段计算漫画记录的指纹"""
+    raw = json.dumps(comic, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def ingest_comic(comic: dict) -> dict:
+    """处理刚从 venera 读取到的漫画记录: 记录指纹并解析更新时间"""
+    comic['fingerprint'] = comic_fingerprint(comic)
+    return normalize_update_time(comic)
+
+
+def is_unchanged(old_comic: dict, new_comic: dict) -> bool:
+    """指纹相同且上次没有失败的漫画视为未变化"""
+    return old_comic.get('fingerprint') == new_comic['fingerprint'] and not old_comic.get('updateFailed')
+
+
+async def broadcast_data_delta(profile: Profile, comics_data: dict, changed: list,
+                               order_changed: bool = True, updated_view_changed: bool = True):
+    """只向前端推送有变化的漫画；顺序变化时附带 ID 顺序，由前端重新组合完整列表"""
+    payload = {
+        "type": "data_delta",
+        "profile": profile.name,
+        "changed": changed,
+        "last_updated": comics_data.get("last_updated"),
+        "check_status": load_check_status(profile),
+    }
+    if order_changed:
+        payload["order"] = [c['id'] for c in comics_data.get("all_comics", [])]
+    if updated_view_changed:
+        payload["updated_ids"] = [c['id'] for c in comics_data.get("updated_comics", [])]
+    await state.publish(payload)
+
+
+async def _sync_search_index(event: dict, raw: str):
+    """其他 worker 更新数据后，同步本进程的搜索索引 (重复应用是无害的)"""
+    if event.get("type") == "data_delta":
+        try:
+            index = profiles.get_profile(event.get("profile")).index
+        except KeyError:
+            return
+        for comic in event.get("changed", []):
+            index.upsert(comic)
+
+
+bus.subscribe(_sync_search_index)
+
 # --- 数据持久化 ---
 
 
-def save_data(data: dict):
-    with open(config.DATA_FILE, "w", encoding="utf-8") as f:
+def save_data(data: dict, profile: Profile = None):
+    data_file = (profile or profiles.get_profile()).data_file
+    with open(data_file, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=4)
 
 
-def load_data() -> dict:
-    if os.path.exists(config.DATA_FILE):
-        with open(config.DATA_FILE, "r", encoding="utf-8") as f:
+def load_data(profile: Profile = None) -> dict:
+    data_file = (profile or profiles.get_profile()).data_file
+    if os.path.exists(data_file):
+        with open(data_file, "r", encoding="utf-8") as f:
             try:
                 return json.load(f)
             except json.JSONDecodeError:
                 pass
     return {"all_comics": [], "updated_comics": [], "last_updated": "从未"}
 
+
+# 内容未变化的漫画不会改写数据文件 (也不会更新 lastSuccessfulFetchTime)，最近一次检查的时间单独记录在
+# 数据文件旁的小文件中: {"last_checked": 上次完整更新成功获取列表的时间, "checked": {漫画ID: 之后单独检查的时间}}
+# 没有失败标记的漫画，其实际的最近检查时间为记录中的时间和检查记录中较新的一个。
+
+def load_check_status(profile: Profile = None) -> dict:
+    check_file = (profile or profiles.get_profile()).check_file
+    if os.path.exists(check_file):
+        with open(check_file, "r", encoding="utf-8") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                pass
+    return {"last_checked": None, "checked": {}}
+
+
+def save_check_status(status: dict, profile: Profile = None):
+    check_file = (profile or profiles.get_profile()).check_file
+    with open(check_file, "w", encoding="utf-8") as f:
+        json.dump(status, f, ensure_ascii=False)
+
 # --- 邮件通知 ---
 
 
-async def send_email_notification(comic: dict):
-    if not all([config.MAIL_SERVER, config.MAIL_PORT, config.MAIL_USERNAME, config.MAIL_PASSWORD, config.MAIL_RECIPIENT]):
+async def send_email_notification(comic: dict, recipient: str = None):
+    recipient = recipient or config.MAIL_RECIPIENT
+    if not all([config.MAIL_SERVER, config.MAIL_PORT, config.MAIL_USERNAME, config.MAIL_PASSWORD, recipient]):
         print("邮件配置不完整，跳过发送通知。")
         return
 
@@ -79,7 +213,7 @@ async def send_email_notification(comic: dict):
     msg = MIMEMultipart('alternative')
     msg['Subject'] = f"漫画更新提醒: {comic['name']}"
     msg['From'] = config.MAIL_USERNAME
-    msg['To'] = config.MAIL_RECIPIENT
+    msg['To'] = recipient
 
     # --- Base64内嵌图片 ---
     base64_image_src = ""
@@ -150,7 +284,7 @@ async def send_email_notification(comic: dict):
             server.login(config.MAIL_USERNAME, config.MAIL_PASSWORD)
             # 发送邮件
             server.sendmail(config.MAIL_USERNAME, [
-                            config.MAIL_RECIPIENT], msg.as_string())
+                            recipient], msg.as_string())
             print(f"成功发送《{comic['name']}》的更新邮件。")
         except Exception as e:
             # 捕获并打印异常，以便调试
@@ -169,20 +303,60 @@ async def send_email_notification(comic: dict):
 
 # --- 核心业务逻辑 ---
 
+# 同时运行的 venera 进程数量上限，所有 profile 共用
+_venera_slots = asyncio.BoundedSemaphore(config.MAX_CONCURRENT_VENERA)
+
+
+async def run_venera_command_streamed(command: str, flow_id: str, task_id: str, executable_path: str,
+                                      recorder: capture.CaptureRecorder = None, replayer: capture.CaptureReplayer = None,
+                                      profile: Profile = None):
+    if replayer:
+        return await _run_venera_command(command, flow_id, task_id, executable_path, recorder, replayer, profile)
+    # 等待空闲的进程槽位 (不计入命令超时时间)
+    async with _venera_slots:
+        return await _run_venera_command(command, flow_id, task_id, executable_path, recorder, replayer, profile)
+
 
-async def run_venera_command_streamed(command: str, flow_id: str, task_id: str, executable_path: str):
+async def _run_venera_command(command: str, flow_id: str, task_id: str, executable_path: str,
+                              recorder: capture.CaptureRecorder, replayer: capture.CaptureReplayer, profile: Profile):
     await state.start_task(flow_id, task_id, command)
     full_command = f"{executable_path} --headless {command}"
     process = None
+    capture_index = recorder.begin(command) if recorder else None
     try:
         async def _run_and_stream():
             nonlocal process
-            process = await asyncio.create_subprocess_shell(
-                full_command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-            )
             json_prefix = "[CLI PRINT] "
             final_json_output = []
-            while process.returncode is None:
+
+            async def _handle_line(raw_line: str):
+                line = raw_line.strip()
+                parsed_json = None
+                if line.startswith(json_prefix):
+                    try:
+                        json_str = line[len(json_prefix):]
+                        parsed_json = json.loads(json_str)
+                        final_json_output.append(parsed_json)
+                    except json.JSONDecodeError:
+                        pass
+                await state.add_log(flow_id, task_id, line, parsed_json)
+
+            # 回放模式: 从录制文件中读取输出，而不是启动 venera
+            if replayer:
+                async for raw_line in replayer.lines(command):
+                    if state.is_flow_cancelled(flow_id):
+                        await state.add_log(flow_id, task_id, "任务被用户强制终止。", None)
+                        break
+                    await _handle_line(raw_line)
+                return final_json_output
+
+            # 每个 profile 使用自己的 venera 数据目录，运行时文件则共用同一份
+            process = await asyncio.create_subprocess_shell(
+                full_command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                env=profile.subprocess_env() if profile else None,
+                cwd=profile.venera_home if profile else None,
+            )
+            while True:
                 if state.is_flow_cancelled(flow_id):
                     process.terminate()
                     await process.wait()
@@ -191,18 +365,12 @@ async def run_venera_command_streamed(command: str, flow_id: str, task_id: str,
                 try:
                     line_bytes = await asyncio.wait_for(process.stdout.readline(), timeout=1.0)
                     if not line_bytes:
-                        await asyncio.sleep(0.1)
-                        continue
-                    line = line_bytes.decode().strip()
-                    parsed_json = None
-                    if line.startswith(json_prefix):
-                        try:
-                            json_str = line[len(json_prefix):]
-                            parsed_json = json.loads(json_str)
-                            final_json_output.append(parsed_json)
-                        except json.JSONDecodeError:
-                            pass
-                    await state.add_log(flow_id, task_id, line, parsed_json)
+                        # 读到 EOF，说明进程已关闭输出，此时缓冲区中的行都已处理完
+                        break
+                    raw_line = line_bytes.decode(errors="replace").rstrip("\r\n")
+                    if recorder:
+                        recorder.line(capture_index, raw_line)
+                    await _handle_line(raw_line)
                 except asyncio.TimeoutError:
                     continue
                 except Exception as e:
@@ -230,205 +398,247 @@ async def run_venera_command_streamed(command: str, flow_id: str, task_id: str,
         await state.add_log(flow_id, task_id, f"执行命令时发生未知错误: {e}", None)
         await state.end_task(flow_id, task_id)
         return []
-
-
-async def cache_image(url: str):
-    if not url or not url.startswith(('http://', 'https://')):
-        return None
+    finally:
+        if recorder:
+            recorder.end(capture_index)
+
+
+async def run_update_flow(replayer: capture.CaptureReplayer = None, send_email: bool = True,
+                          profile: Profile = None) -> bool:
+    """执行完整的更新流程；另一个进程正在执行同一 profile 的流程时直接返回 False"""
+    profile = profile or profiles.get_profile()
+    if not await profile.flow_lease.acquire():
+        print(f"另一个进程正在执行 profile '{profile.name}' 的更新流程，本次更新跳过。")
+        return False
     try:
-        url_hash = hashlib.sha256(url.encode()).hexdigest()
-        file_ext = os.path.splitext(url)[1] or ".jpg"
-        local_filename = f"{url_hash}{file_ext}"
-        local_filepath = os.path.join(config.CACHE_DIR, local_filename)
-        if os.path.exists(local_filepath):
-            return f"/cache/comic_cover/{local_filename}"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, follow_redirects=True)
-            response.raise_for_status()
-        async with await anyio.open_file(local_filepath, "wb") as f:
-            await f.write(response.content)
-        return f"/cache/comic_cover/{local_filename}"
-    except Exception as e:
-        print(f"图片缓存失败: {url}, 错误: {e}")
-        return None
+        await _run_update_flow(replayer, send_email, profile)
+        return True
+    finally:
+        await profile.flow_lease.release()
 
 
-async def run_update_flow():
+async def _run_update_flow(replayer: capture.CaptureReplayer, send_email: bool, profile: Profile):
     from app.main import get_venera_executable_path
     executable_path = get_venera_executable_path()
 
     flow_id = str(uuid.uuid4())
-    state.start_flow(flow_id)
-
-    old_data = load_data()
-    old_comics_map = {
-        comic['id']: comic for comic in old_data.get('all_comics', [])}
-
-    await run_venera_command_streamed("webdav down", flow_id, f"webdav_down_{flow_id}", executable_path)
-    await run_venera_command_streamed("updatescript all", flow_id, f"updatescript_{flow_id}", executable_path)
-    await run_venera_command_streamed("webdav up", flow_id, f"webdav_up_{flow_id}", executable_path)
-    final_output = await run_venera_command_streamed("updatesubscribe", flow_id, f"updatesubscribe_{flow_id}", executable_path)
-
-    all_comics_set = {}
-    for item in final_output:
-        if item.get("message") == "Progress" and "comic" in item.get("data", {}):
-            all_comics_set[item["data"]["comic"]["id"]] = item["data"]["comic"]
-
-    updated_comics_list = []
-    if final_output and final_output[-1].get("message") == "Updated comics list.":
-        updated_comics_list = final_output[-1].get("data", [])
-
-    def sort_key(comic):
-        """使用辅助函数解析日期，并返回一个可供排序的对象"""
-        dt = parse_comic_update_time(comic.get('updateTime'))
-        if not dt:
-            # 将无法解析的日期排在最后
-            return datetime.min.replace(tzinfo=None)
-
-        # 如果有时区信息，则转换为本地时间以便统一比较
-        if dt.tzinfo:
-            return dt.astimezone(None).replace(tzinfo=None)
-        return dt
-
-    # --- 整合新旧数据，并标记失败的条目 ---
-    if not all_comics_set and old_comics_map:
-        print("警告: 'updatesubscribe' 未返回任何漫画数据，但之前存在数据。可能发生了错误，跳过本次数据更新。")
-        # 标记所有漫画为更新失败
-        for comic in old_comics_map.values():
-            comic['updateFailed'] = True
-            comic['failure_count'] = comic.get('failure_count', 0) + 1
-        comics_data = old_data
-        comics_data['all_comics'] = list(old_comics_map.values())
-        save_data(comics_data)
-        await manager.broadcast(json.dumps({"type": "data_updated", "data": comics_data}))
-        await state.end_flow(flow_id)
-        return
+    await state.start_flow(flow_id, profile.name)
+    # 回放时不再重复录制
+    recorder = None if replayer else capture.start_recording(flow_id, "full", profile=profile.name)
+    streamed = dict(recorder=recorder, replayer=replayer, profile=profile)
 
-    final_all_comics_list = []
-    for comic_id, old_comic in old_comics_map.items():
-        if comic_id in all_comics_set:
-            # 本次成功更新
-            new_comic = all_comics_set[comic_id]
-            new_comic['updateFailed'] = False
-            new_comic['failure_count'] = 0
-            final_all_comics_list.append(new_comic)
-        else:
-            # 本次更新失败，保留旧数据并标记
-            old_comic['updateFailed'] = True
-            old_comic['failure_count'] = old_comic.get('failure_count', 0) + 1
-            final_all_comics_list.append(old_comic)
-
-    # 处理本次新添加的漫画
-    for comic_id, new_comic in all_comics_set.items():
-        if comic_id not in old_comics_map:
-            new_comic['updateFailed'] = False
-            final_all_comics_list.append(new_comic)
-
-    all_comics = sorted(final_all_comics_list, key=sort_key, reverse=True)
-    # `updated_comics_list` 只包含ID，我们需要从 `all_comics_set` 获取完整数据
-    updated_comics_ids = {c['id'] for c in updated_comics_list}
-    updated_comics = sorted([c for c in all_comics if c['id']
-                            in updated_comics_ids], key=sort_key, reverse=True)
-
-    newly_updated_for_email = []
-    current_fetch_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-
-    async def process_comics(comics, fetch_time: str):
-        tasks = [cache_image(c.get("coverUrl")) for c in comics]
-        cached_urls = await asyncio.gather(*tasks)
-        for comic, url in zip(comics, cached_urls):
+    # 流程出错时同样关闭录制文件并结束流程，避免留下未写完的录制文件和一直显示为运行中的流程
+    try:
+        old_data = load_data(profile)
+        old_comics_map = {
+            comic['id']: comic for comic in old_data.get('all_comics', [])}
+
+        await run_venera_command_streamed("webdav down", flow_id, f"webdav_down_{flow_id}", executable_path, **streamed)
+        await run_venera_command_streamed("updatescript all", flow_id, f"updatescript_{flow_id}", executable_path, **streamed)
+        await run_venera_command_streamed("webdav up", flow_id, f"webdav_up_{flow_id}", executable_path, **streamed)
+        final_output = await run_venera_command_streamed("updatesubscribe", flow_id, f"updatesubscribe_{flow_id}", executable_path, **streamed)
+
+        all_comics_set = {}
+        for item in final_output:
+            if item.get("message") == "Progress" and "comic" in item.get("data", {}):
+                all_comics_set[item["data"]["comic"]["id"]] = ingest_comic(item["data"]["comic"])
+
+        updated_comics_list = []
+        if final_output and final_output[-1].get("message") == "Updated comics list.":
+            updated_comics_list = final_output[-1].get("data", [])
+
+        # --- 整合新旧数据，并标记失败的条目 ---
+        if not all_comics_set and old_comics_map:
+            print("警告: 'updatesubscribe' 未返回任何漫画数据，但之前存在数据。可能发生了错误，跳过本次数据更新。")
+            # 标记所有漫画为更新失败
+            for comic in old_comics_map.values():
+                comic['updateFailed'] = True
+                comic['failure_count'] = comic.get('failure_count', 0) + 1
+            comics_data = old_data
+            comics_data['all_comics'] = list(old_comics_map.values())
+            save_data(comics_data, profile)
+            profile.index.sync(comics_data["all_comics"])
+            await broadcast_data_delta(profile, comics_data, comics_data['all_comics'], order_changed=False, updated_view_changed=False)
+            return
+
+        # --- 根据指纹将漫画分为未变化、有变化和新增三类 ---
+        # 旧列表已按更新时间排序，只有更新时间变化的漫画和新漫画需要重新定位
+        final_all_comics_list = []
+        moved_comics = []
+        changed_comics = []   # 内容有变化或新增的漫画 (本次成功获取)
+        failed_comics = []    # 本次更新失败的漫画
+        for comic_id, old_comic in old_comics_map.items():
+            if comic_id in all_comics_set:
+                new_comic = all_comics_set[comic_id]
+                if is_unchanged(old_comic, new_comic):
+                    # 内容未变化，直接沿用旧记录 (包括已缓存的封面和获取时间)
+                    final_all_comics_list.append(old_comic)
+                    continue
+                # 本次成功更新
+                new_comic['updateFailed'] = False
+                new_comic['failure_count'] = 0
+                changed_comics.append(new_comic)
+                if comic_sort_key(new_comic) == comic_sort_key(old_comic):
+                    final_all_comics_list.append(new_comic)
+                else:
+                    moved_comics.append(new_comic)
+            else:
+                # 本次更新失败，保留旧数据并标记
+                old_comic['updateFailed'] = True
+                old_comic['failure_count'] = old_comic.get('failure_count', 0) + 1
+                failed_comics.append(old_comic)
+                final_all_comics_list.append(old_comic)
+
+        # 处理本次新添加的漫画
+        for comic_id, new_comic in all_comics_set.items():
+            if comic_id not in old_comics_map:
+                new_comic['updateFailed'] = False
+                changed_comics.append(new_comic)
+                moved_comics.append(new_comic)
+
+        all_comics = final_all_comics_list
+        # 兼容旧版本写入的未排序数据
+        ensure_sorted(all_comics)
+        order_changed = bool(moved_comics)
+        merge_sorted(all_comics, moved_comics)
+        # `updated_comics_list` 只包含ID，我们需要从 `all_comics_set` 获取完整数据
+        # 从有序的 all_comics 中筛选，结果自然也是有序的
+        updated_comics_ids = {c['id'] for c in updated_comics_list}
+        updated_comics = [c for c in all_comics if c['id'] in updated_comics_ids]
+        updated_view_changed = [c['id'] for c in updated_comics] != [c['id'] for c in old_data.get('updated_comics', [])]
+
+        # 封面只需处理有变化的漫画，以及之前缓存失败 (仍为远程地址) 的未变化漫画
+        changed_ids = {c['id'] for c in changed_comics}
+        cover_retry_comics = [c for c in all_comics
+                              if c['id'] not in changed_ids and not c.get('updateFailed') and is_remote_url(c.get('coverUrl'))]
+        cover_targets = changed_comics + cover_retry_comics
+        cached_urls = await asyncio.gather(*(cache_image(c.get("coverUrl")) for c in cover_targets))
+        backoff = get_failure_stats()
+        if backoff["urls"] or backoff["hosts"]:
+            print(f"封面下载退避中: {backoff['urls']} 个地址, {backoff['hosts']} 个主机，本次跳过。")
+        cover_fixed_comics = []
+        for comic, url in zip(cover_targets, cached_urls):
             if url:
                 comic["coverUrl"] = url
+                if comic['id'] not in changed_ids:
+                    cover_fixed_comics.append(comic)
 
+        newly_updated_for_email = []
+        current_fetch_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        for comic in changed_comics:
             old_comic = old_comics_map.get(comic['id'])
+            if old_comic:
+                # 继承上一次的成功获取时间，作为“上次”记录
+                if 'lastSuccessfulFetchTime' in old_comic:
+                    comic['previousSuccessfulFetchTime'] = old_comic['lastSuccessfulFetchTime']
 
-            # 只为成功更新的漫画处理时间戳和邮件
-            if not comic.get('updateFailed'):
-                if old_comic:
-                    # 继承上一次的成功获取时间，作为“上次”记录
-                    if 'lastSuccessfulFetchTime' in old_comic:
-                        comic['previousSuccessfulFetchTime'] = old_comic['lastSuccessfulFetchTime']
-
-                    # 检查内容更新时间戳，用于邮件通知
-                    if old_comic.get('updateTime') != comic.get('updateTime'):
-                        print(f"检测到漫画 '{comic['name']}' 更新，准备发送邮件。")
-                        newly_updated_for_email.append(comic)
-
-                # 记录本次成功获取的时间
-                comic['lastSuccessfulFetchTime'] = fetch_time
-
-        return comics
-
-    comics_data = load_data()
-    # 注意：现在 all_comics 已经包含了所有条目（成功和失败的）
-    comics_data["all_comics"] = await process_comics(all_comics, current_fetch_time)
-    comics_data["updated_comics"] = await process_comics(updated_comics, current_fetch_time)
-    comics_data["last_updated"] = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    save_data(comics_data)
-
-    # webdav up 可能会失败，但不应阻塞邮件发送
-    try:
-        await run_venera_command_streamed("webdav up", flow_id, f"webdav_up_final_{flow_id}", executable_path)
-    except Exception as e:
-        print(f"最后的 webdav up 失败: {e}")
+                # 检查内容更新时间戳，用于邮件通知
+                if old_comic.get('updateTime') != comic.get('updateTime'):
+                    print(f"检测到漫画 '{comic['name']}' 更新，准备发送邮件。")
+                    newly_updated_for_email.append(comic)
 
-    if newly_updated_for_email:
-        email_tasks = [send_email_notification(
-            comic) for comic in newly_updated_for_email]
-        await asyncio.gather(*email_tasks)
+            # 记录本次成功获取的时间
+            comic['lastSuccessfulFetchTime'] = current_fetch_time
 
-    await manager.broadcast(json.dumps({"type": "data_updated", "data": comics_data}))
-    await state.end_flow(flow_id)
+        delta_comics = changed_comics + failed_comics + cover_fixed_comics
+        comics_data = old_data
+        if delta_comics or order_changed or updated_view_changed:
+            # 注意：现在 all_comics 已经包含了所有条目（成功和失败的）
+            comics_data["all_comics"] = all_comics
+            comics_data["updated_comics"] = updated_comics
+            comics_data["last_updated"] = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+            save_data(comics_data, profile)
+            # 只有变化的漫画需要更新搜索索引
+            for comic in delta_comics:
+                profile.index.upsert(comic)
+            print(f"数据已更新: {len(changed_comics)} 部有变化, {len(failed_comics)} 部更新失败, "
+                  f"{len(cover_fixed_comics)} 部补全封面, {len(all_comics) - len(delta_comics)} 部未变化。")
+        else:
+            print("所有漫画的指纹与上次相同，跳过数据写入。")
+        # 所有成功获取的漫画都已检查过，之前单独检查的记录不再需要
+        save_check_status({"last_checked": current_fetch_time, "checked": {}}, profile)
 
+        # webdav up 可能会失败，但不应阻塞邮件发送
+        try:
+            await run_venera_command_streamed("webdav up", flow_id, f"webdav_up_final_{flow_id}", executable_path, **streamed)
+        except Exception as e:
+            print(f"最后的 webdav up 失败: {e}")
+
+        if newly_updated_for_email and not send_email:
+            print(f"已跳过 {len(newly_updated_for_email)} 封更新邮件的发送。")
+        elif newly_updated_for_email:
+            email_tasks = [send_email_notification(
+                comic, profile.mail_recipient) for comic in newly_updated_for_email]
+            await asyncio.gather(*email_tasks)
+
+        await broadcast_data_delta(profile, comics_data, delta_comics,
+                                   order_changed=order_changed, updated_view_changed=updated_view_changed)
+    except Exception:
+        # 流程出错时同样推送一条空的增量消息，让前端结束更新状态
+        await broadcast_data_delta(profile, load_data(profile), [], order_changed=False, updated_view_changed=False)
+        raise
+    finally:
+        if recorder:
+            recorder.close()
+        await state.end_flow(flow_id)
 
-async def run_single_update_flow(comic_id: str, comic_type: str):
-    from app.main import get_venera_executable_path
-    executable_path = get_venera_executable_path()
 
-    flow_id = str(uuid.uuid4())
-    state.start_flow(flow_id)
+async def run_single_update_flow(comic_id: str, comic_type: str, replayer: capture.CaptureReplayer = None,
+                                 profile: Profile = None) -> bool:
+    """更新单个漫画；另一个进程正在执行同一 profile 的流程时直接返回 False"""
+    return await run_batch_update_flow([(comic_id, comic_type)], replayer, profile)
 
-    command = f'updatesubscribe --update-comic-by-id-type "{comic_id}" "{comic_type}"'
-    task_id = f"update_single_{comic_id}_{flow_id}"
 
-    final_output = await run_venera_command_streamed(command, flow_id, task_id, executable_path)
+async def run_batch_update_flow(comics: list, replayer: capture.CaptureReplayer = None, profile: Profile = None) -> bool:
+    """在同一个流程中依次更新多个漫画 [(comic_id, comic_type), ...]，数据只读写一次"""
+    profile = profile or profiles.get_profile()
+    if not await profile.flow_lease.acquire():
+        print(f"另一个进程正在执行 profile '{profile.name}' 的更新流程，{len(comics)} 个漫画的更新跳过。")
+        return False
+    try:
+        await _run_batch_update_flow(comics, replayer, profile)
+        return True
+    finally:
+        await profile.flow_lease.release()
 
-    updated_comic_data = None
-    for item in final_output:
-        if item.get("message") == "Progress" and "comic" in item.get("data", {}):
-            if item["data"]["comic"]["id"] == comic_id:
-                updated_comic_data = item["data"]["comic"]
-                break  # 找到目标漫画后即可退出
 
-    comics_data = load_data()
-    found = False
-    for i, comic in enumerate(comics_data["all_comics"]):
-        if comic["id"] == comic_id:
-            if updated_comic_data:
-                # --- 更新成功 ---
-                old_comic = comic
-                updated_comic_data['updateFailed'] = False
-                updated_comic_data['failure_count'] = 0
-                if 'lastSuccessfulFetchTime' in old_comic:
-                    updated_comic_data['previousSuccessfulFetchTime'] = old_comic['lastSuccessfulFetchTime']
-                updated_comic_data['lastSuccessfulFetchTime'] = datetime.utcnow().strftime(
-                    "%Y-%m-%d %H:%M:%S")
+async def _merge_single_result(comics_data: dict, comic_id: str, updated_comic_data: Union[dict, None]) -> list:
+    """将单个漫画的更新结果合并到数据中，返回有变化的记录"""
+    for comic in comics_data["all_comics"]:
+        if comic["id"] != comic_id:
+            continue
+        if updated_comic_data and is_unchanged(comic, updated_comic_data):
+            # --- 内容未变化，沿用旧记录 ---
+            return []
+        if not updated_comic_data:
+            # --- 更新失败 ---
+            comic['updateFailed'] = True
+            comic['failure_count'] = comic.get('failure_count', 0) + 1
+            return [comic]
 
-                cached_url = await cache_image(updated_comic_data.get("coverUrl"))
-                if cached_url:
-                    updated_comic_data["coverUrl"] = cached_url
+        # --- 更新成功 ---
+        old_comic = comic
+        updated_comic_data['updateFailed'] = False
+        updated_comic_data['failure_count'] = 0
+        if 'lastSuccessfulFetchTime' in old_comic:
+            updated_comic_data['previousSuccessfulFetchTime'] = old_comic['lastSuccessfulFetchTime']
+        updated_comic_data['lastSuccessfulFetchTime'] = datetime.utcnow().strftime(
+            "%Y-%m-%d %H:%M:%S")
 
-                comics_data["all_comics"][i] = updated_comic_data
-            else:
-                # --- 更新失败 ---
-                comics_data["all_comics"][i]['updateFailed'] = True
-                comics_data["all_comics"][i]['failure_count'] = comic.get('failure_count', 0) + 1
+        cached_url = await cache_image(updated_comic_data.get("coverUrl"))
+        if cached_url:
+            updated_comic_data["coverUrl"] = cached_url
 
-            found = True
-            break
+        # 只有更新时间变化时才移动位置，不必重新排序整个列表
+        replace_sorted(comics_data["all_comics"], old_comic, updated_comic_data)
+        for updated_comic in comics_data.get("updated_comics", []):
+            if updated_comic["id"] == comic_id:
+                replace_sorted(comics_data["updated_comics"], updated_comic, updated_comic_data)
+                break
+        return [updated_comic_data]
 
     # 如果是全新的漫画并且更新成功
-    if not found and updated_comic_data:
+    if updated_comic_data:
         updated_comic_data['updateFailed'] = False
         updated_comic_data['failure_count'] = 0
         updated_comic_data['lastSuccessfulFetchTime'] = datetime.utcnow().strftime(
@@ -436,11 +646,181 @@ async def run_single_update_flow(comic_id: str, comic_type: str):
         cached_url = await cache_image(updated_comic_data.get("coverUrl"))
         if cached_url:
             updated_comic_data["coverUrl"] = cached_url
-        comics_data["all_comics"].append(updated_comic_data)
+        insert_sorted(comics_data["all_comics"], updated_comic_data)
+        return [updated_comic_data]
+    return []
 
-    # 无论成功与否，都保存并广播数据，以确保前端UI同步
-    comics_data["last_updated"] = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    save_data(comics_data)
-    await manager.broadcast(json.dumps({"type": "data_updated", "data": comics_data}))
 
-    await state.end_flow(flow_id)
+async def _run_batch_update_flow(comics: list, replayer: capture.CaptureReplayer, profile: Profile):
+    from app.main import get_venera_executable_path
+    executable_path = get_venera_executable_path()
+
+    flow_id = str(uuid.uuid4())
+    await state.start_flow(flow_id, profile.name)
+    recorder = None if replayer else capture.start_recording(
+        flow_id, "batch", profile=profile.name, comics=[[comic_id, comic_type] for comic_id, comic_type in comics])
+
+    # venera 每次调用只能更新一个漫画，这里依次执行，但共享同一个流程和一次数据读写
+    results = {}
+    try:
+        for comic_id, comic_type in comics:
+            if state.is_flow_cancelled(flow_id):
+                print(f"流程 {flow_id} 已被取消，剩余的漫画不再更新。")
+                break
+            command = f'updatesubscribe --update-comic-by-id-type "{comic_id}" "{comic_type}"'
+            task_id = f"update_single_{comic_id}_{flow_id}"
+
+            final_output = await run_venera_command_streamed(
+                command, flow_id, task_id, executable_path, recorder=recorder, replayer=replayer, profile=profile)
+
+            results[comic_id] = None
+            for item in final_output:
+                if item.get("message") == "Progress" and "comic" in item.get("data", {}):
+                    if item["data"]["comic"]["id"] == comic_id:
+                        results[comic_id] = ingest_comic(item["data"]["comic"])
+                        break  # 找到目标漫画后即可退出
+
+        comics_data = load_data(profile)
+        changed = []
+        for comic_id, updated_comic_data in results.items():
+            changed.extend(await _merge_single_result(comics_data, comic_id, updated_comic_data))
+
+        if changed:
+            comics_data["last_updated"] = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+            save_data(comics_data, profile)
+            for comic in changed:
+                profile.index.upsert(comic)
+        else:
+            print(f"{len(results)} 个漫画的指纹与上次相同，跳过数据写入。")
+        check_status = load_check_status(profile)
+        checked_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        for comic_id, updated_comic_data in results.items():
+            if updated_comic_data:
+                check_status["checked"][comic_id] = checked_at
+        save_check_status(check_status, profile)
+
+        # 无论成功与否都通知前端，以确保前端UI同步 (没有变化时只是一条空的增量消息)
+        await broadcast_data_delta(profile, comics_data, changed, order_changed=bool(changed), updated_view_changed=bool(changed))
+    except Exception:
+        # 流程出错时同样推送一条空的增量消息，让前端结束更新状态
+        await broadcast_data_delta(profile, load_data(profile), [], order_changed=False, updated_view_changed=False)
+        raise
+    finally:
+        if recorder:
+            recorder.close()
+        await state.end_flow(flow_id)
+
+
+async def replay_capture(path: str, pacing: str = "fast", send_email: bool = False):
+    """将录制文件重新送入解析、合并、封面缓存和通知流程"""
+    replayer = capture.CaptureReplayer(path, pacing)
+    # 旧版本的录制文件没有 profile，回放到默认 profile
+    profile = profiles.get_profile(replayer.args.get("profile"))
+    print(f"开始回放录制文件: {path} (节奏: {pacing}, profile: {profile.name})")
+    # 单个漫画和批量更新的流程本身不发送邮件
+    if replayer.kind == "batch":
+        await run_batch_update_flow([tuple(c) for c in replayer.args["comics"]], replayer=replayer, profile=profile)
+    elif replayer.kind == "single":
+        await run_single_update_flow(replayer.args["comic_id"], replayer.args["comic_type"], replayer=replayer,
+                                     profile=profile)
+    else:
+        await run_update_flow(replayer=replayer, send_email=send_email, profile=profile)
+
+
+# --- 更新请求队列 ---
+#
+# 流程运行期间收到的更新请求先进入队列，由后台任务在流程锁空闲后依次执行:
+# 重复的等待中请求直接返回已有票据；等待中的完整更新会吸收所有单个漫画请求；
+# 积压的单个漫画请求合并为一次批量流程，数量较多时直接改为完整更新。
+# 每个 profile 有独立的队列和后台任务，不同 profile 的流程可以同时运行。
+# 队列只保存在本进程中: 多进程部署时只合并发到同一进程的请求，各进程的流程通过流程锁依次执行。
+
+# profile 名称 -> 执行该 profile 队列的后台任务
+_queue_workers = {}
+
+
+async def enqueue_full_update(profile: Profile = None) -> dict:
+    """请求一次完整更新，返回可通过 WebSocket 跟踪的票据"""
+    profile = profile or profiles.get_profile()
+    pending_full = state.pending_full.get(profile.name)
+    if pending_full:
+        return dict(state.tickets[pending_full], duplicate=True)
+
+    ticket = state.create_ticket("full", profile.name)
+    state.pending_full[profile.name] = ticket["ticket"]
+    merged = list(state.pending_singles[profile.name].values())
+    state.pending_singles[profile.name].clear()
+    await state.set_ticket_status(ticket["ticket"], "queued")
+    # 完整更新会覆盖所有等待中的单个漫画请求
+    for ticket_id in merged:
+        await state.set_ticket_status(ticket_id, "merged", into=ticket["ticket"])
+    _ensure_queue_worker(profile)
+    return dict(ticket)
+
+
+async def enqueue_single_update(comic_id: str, comic_type: str, profile: Profile = None) -> dict:
+    """请求更新单个漫画，返回可通过 WebSocket 跟踪的票据"""
+    profile = profile or profiles.get_profile()
+    pending_full = state.pending_full.get(profile.name)
+    if pending_full:
+        # 等待中的完整更新会包含这个漫画
+        return dict(state.tickets[pending_full], duplicate=True)
+    pending_singles = state.pending_singles[profile.name]
+    key = (comic_id, comic_type)
+    if key in pending_singles:
+        return dict(state.tickets[pending_singles[key]], duplicate=True)
+
+    ticket = state.create_ticket("single", profile.name, [key])
+    pending_singles[key] = ticket["ticket"]
+    await state.set_ticket_status(ticket["ticket"], "queued")
+    _ensure_queue_worker(profile)
+    return dict(ticket)
+
+
+def _ensure_queue_worker(profile: Profile):
+    worker = _queue_workers.get(profile.name)
+    if worker is None or worker.done():
+        _queue_workers[profile.name] = asyncio.create_task(_process_queue(profile))
+
+
+def _take_next_job(profile: Profile):
+    """取出下一批要执行的请求，返回 (票据ID列表, 漫画列表或 None 表示完整更新)"""
+    pending_full = state.pending_full.pop(profile.name, None)
+    if pending_full:
+        return [pending_full], None
+
+    pending_singles = state.pending_singles[profile.name]
+    batch = list(pending_singles.items())
+    pending_singles.clear()
+    ticket_ids = [ticket_id for _, ticket_id in batch]
+    comics = [key for key, _ in batch]
+    if len(comics) >= config.QUEUE_FULL_UPDATE_THRESHOLD:
+        # 一次完整更新只需启动一次 venera，比逐个更新更快
+        print(f"profile '{profile.name}' 积压了 {len(comics)} 个单个漫画更新请求，改为执行一次完整更新。")
+        return ticket_ids, None
+    return ticket_ids, comics
+
+
+async def _process_queue(profile: Profile):
+    while state.pending_full.get(profile.name) or state.pending_singles[profile.name]:
+        # 等待其他进程 (或回放) 中同一 profile 的流程结束
+        if not await profile.flow_lease.acquire():
+            await asyncio.sleep(config.QUEUE_RETRY_SECONDS)
+            continue
+        try:
+            ticket_ids, comics = _take_next_job(profile)
+            for ticket_id in ticket_ids:
+                await state.set_ticket_status(ticket_id, "running")
+            status = "done"
+            try:
+                if comics is None:
+                    await run_update_flow(profile=profile)
+                else:
+                    await run_batch_update_flow(comics, profile=profile)
+            except Exception as e:
+                print(f"profile '{profile.name}' 队列中的更新流程执行失败: {e}")
+                status = "failed"
+            for ticket_id in ticket_ids:
+                await state.set_ticket_status(ticket_id, status)
+        finally:
+            await profile.flow_lease.release()
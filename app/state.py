@@ -1,33 +1,104 @@
-import json
 import asyncio
 import time
-from collections import OrderedDict
+import uuid
+from collections import OrderedDict, defaultdict
 
+from app import config
+from app.bus import bus
 from app.websocket import manager
 
 # --- 全局状态管理器 ---
+# 状态的每次变化都作为事件发布到事件总线，所有进程 (包括发布者自己) 都通过
+# handle_event 更新各自的副本，因此任何 worker 上的客户端都能看到完整的流程状态。
 # 使用 OrderedDict 来保持任务插入的顺序
 running_tasks = OrderedDict()
 # 用于存储被用户请求取消的流程ID
 cancelled_flows = set()
+# 等待移除已结束流程的后台任务
+_removal_tasks = set()
+
+# --- 更新请求队列 ---
+# 票据和等待中的请求只保存在收到请求的进程中 (不随事件同步)，其他进程只会转发它们的 ticket_update
+# 票据ID -> 票据信息，只保留最近的 MAX_TICKETS 个
+tickets = OrderedDict()
+MAX_TICKETS = 200
+# 每个 profile 等待执行的完整更新的票据ID (最多一个): profile -> 票据ID
+pending_full = {}
+# 每个 profile 等待执行的单个漫画更新: profile -> {(comic_id, comic_type): 票据ID}
+pending_singles = defaultdict(OrderedDict)
+
+# 只用于同步状态、不推送给前端的事件类型
+INTERNAL_EVENTS = {"flow_start", "flow_end", "flow_remove", "flow_cancel"}
+
+
+async def publish(event: dict):
+    """Publishes an event to every worker (state replicas and WebSocket clients)."""
+    # 记录发布时间: 新进程回放历史事件时，据此判断流程最后一次活动的时间
+    await bus.publish(dict(event, ts=time.time()))
+
+
+async def handle_event(event: dict, raw: str):
+    """Applies an event from the bus to the local state and forwards it to local clients."""
+    kind = event.get("type")
+    flow_id = event.get("flowId")
+    flow = running_tasks.get(flow_id)
+    # 使用事件的发布时间而不是收到的时间，回放的旧事件不会让已经中断的流程显得仍在运行
+    published = event.get("ts", time.time())
+    if flow is not None:
+        flow["updated"] = max(flow["updated"], published)
+    # 流程内的事件 (日志等) 不重复携带 profile，从流程记录中取得
+    profile = event.get("profile") or (flow or {}).get("profile")
+
+    if kind == "flow_start":
+        cancelled_flows.discard(flow_id)
+        running_tasks[flow_id] = {
+            "active": True,
+            "flowId": flow_id, # 将 flow_id 也加入，方便前端获取
+            "origin": event.get("origin"),
+            "profile": profile,
+            "updated": published,
+            "tasks": OrderedDict()
+        }
+    elif kind == "flow_end":
+        if flow is not None:
+            flow["active"] = False
+    elif kind == "flow_remove":
+        running_tasks.pop(flow_id, None)
+        cancelled_flows.discard(flow_id)
+    elif kind == "flow_cancel":
+        cancelled_flows.add(flow_id)
+    elif kind == "task_start":
+        if flow is not None:
+            flow["tasks"][event["taskId"]] = dict(event, logs=list(event.get("logs", [])))
+    elif kind in ("log", "task_end"):
+        task = flow["tasks"].get(event["taskId"]) if flow is not None else None
+        if task is not None:
+            if kind == "task_end":
+                task["status"] = "complete"
+            else:
+                # Store log for state reconstruction
+                task["logs"].append(event["data"])
+                parsed = event.get("parsed")
+                if parsed:
+                    progress_data = parsed.get("data", {})
+                    task["progress"] = {"current": progress_data.get("current", 0), "total": progress_data.get("total", 0)}
+
+    if kind not in INTERNAL_EVENTS:
+        await manager.broadcast(raw, profile, event)
+
+
+bus.subscribe(handle_event)
+
 
 async def update_and_broadcast(flow_id: str, task_id: str, update_data: dict):
     """Helper to update state and broadcast the change."""
     if flow_id in running_tasks and task_id in running_tasks[flow_id]['tasks']:
         running_tasks[flow_id]['tasks'][task_id].update(update_data)
-        await manager.broadcast(json.dumps(update_data))
-
-def start_flow(flow_id: str):
-    """Marks the start of a new update flow."""
-    # 如果之前有取消标记，先清除
-    if flow_id in cancelled_flows:
-        cancelled_flows.remove(flow_id)
-        
-    running_tasks[flow_id] = {
-        "active": True,
-        "flowId": flow_id, # 将 flow_id 也加入，方便前端获取
-        "tasks": OrderedDict()
-    }
+        await publish(update_data)
+
+async def start_flow(flow_id: str, profile: str = None):
+    """Marks the start of a new update flow for a profile."""
+    await publish({"type": "flow_start", "flowId": flow_id, "origin": bus.origin, "profile": profile})
 
 async def start_task(flow_id: str, task_id: str, command: str):
     """Adds a new task to the running flow."""
@@ -42,65 +113,91 @@ async def start_task(flow_id: str, task_id: str, command: str):
             "logs": [],
             "progress": {"current": 0, "total": 0}
         }
-        running_tasks[flow_id]['tasks'][task_id] = task_state
-        await manager.broadcast(json.dumps(task_state))
+        await publish(task_state)
 
 async def add_log(flow_id: str, task_id: str, log: str, parsed: dict = None):
     """Adds a log entry and potential progress update to a task."""
     if flow_id in running_tasks and task_id in running_tasks[flow_id]['tasks']:
-        # Store log for state reconstruction
-        running_tasks[flow_id]['tasks'][task_id]['logs'].append(log)
-        
         # Prepare broadcast message
-        payload = {"type": "log", "taskId": task_id, "data": log}
+        payload = {"type": "log", "flowId": flow_id, "taskId": task_id, "data": log}
         if parsed and parsed.get("message") == "Progress":
-            progress_data = parsed.get("data", {})
-            current, total = progress_data.get("current", 0), progress_data.get("total", 0)
-            running_tasks[flow_id]['tasks'][task_id]['progress'] = {"current": current, "total": total}
             payload["parsed"] = parsed
-        
-        await manager.broadcast(json.dumps(payload))
+        await publish(payload)
 
 async def end_task(flow_id: str, task_id: str):
     """Marks a task as complete."""
     if flow_id in running_tasks and task_id in running_tasks[flow_id]['tasks']:
-        running_tasks[flow_id]['tasks'][task_id]['status'] = "complete"
-        payload = {"type": "task_end", "taskId": task_id}
-        await manager.broadcast(json.dumps(payload))
+        await publish({"type": "task_end", "flowId": flow_id, "taskId": task_id})
+
+async def _remove_flow_later(flow_id: str):
+    # Keep completed flow data for a short period for late-connecting clients
+    await asyncio.sleep(5)
+    await publish({"type": "flow_remove", "flowId": flow_id})
 
 async def end_flow(flow_id: str):
     """Marks the end of an update flow and schedules its removal."""
     if flow_id in running_tasks:
-        running_tasks[flow_id]['active'] = False
-        # Keep completed flow data for a short period for late-connecting clients
-        await asyncio.sleep(5)
-        if flow_id in running_tasks:
-            running_tasks.pop(flow_id)
-        if flow_id in cancelled_flows:
-            cancelled_flows.remove(flow_id)
-
-def cancel_flow(flow_id: str):
-    """Marks a flow to be cancelled."""
+        await publish({"type": "flow_end", "flowId": flow_id})
+        # 在后台移除，流程 (以及它持有的流程锁) 无需等待
+        task = asyncio.create_task(_remove_flow_later(flow_id))
+        _removal_tasks.add(task)
+        task.add_done_callback(_removal_tasks.discard)
+
+async def cancel_flow(flow_id: str):
+    """Marks a flow to be cancelled (on whichever worker is running it)."""
     print(f"请求取消流程: {flow_id}")
-    cancelled_flows.add(flow_id)
+    await publish({"type": "flow_cancel", "flowId": flow_id})
 
 def is_flow_cancelled(flow_id: str) -> bool:
     """Checks if a flow has been marked for cancellation."""
     return flow_id in cancelled_flows
 
-def get_current_state() -> dict:
-    """Gets the state of all currently running tasks for a new client."""
+def create_ticket(kind: str, profile: str, comics: list = None) -> dict:
+    """Creates a queue ticket for an update request."""
+    ticket = {"ticket": str(uuid.uuid4()), "kind": kind, "profile": profile, "status": "new", "created": time.time()}
+    if comics is not None:
+        ticket["comics"] = [{"id": comic_id, "type": comic_type} for comic_id, comic_type in comics]
+    tickets[ticket["ticket"]] = ticket
+    # 丢弃最早的已结束票据
+    while len(tickets) > MAX_TICKETS:
+        oldest = next(iter(tickets))
+        if tickets[oldest]["status"] in ("queued", "running"):
+            break
+        tickets.pop(oldest)
+    return ticket
+
+async def set_ticket_status(ticket_id: str, status: str, **extra):
+    """Updates a ticket and broadcasts it as a ticket_update event."""
+    ticket = tickets.get(ticket_id)
+    if ticket is None:
+        return
+    ticket.update(extra, status=status)
+    await publish(dict(ticket, type="ticket_update"))
+
+def get_queue(profile: str = None) -> list:
+    """Tickets that are still waiting or running (optionally for one profile)."""
+    return [t for t in tickets.values()
+            if t["status"] in ("queued", "running") and profile in (None, t["profile"])]
+
+def _is_stale(flow_data: dict) -> bool:
+    """Flows owned by another worker that stopped reporting (e.g. the worker died)."""
+    return flow_data.get("origin") != bus.origin and time.time() - flow_data.get("updated", 0) > config.FLOW_STALE_SECONDS
+
+def get_current_state(profile: str = None) -> dict:
+    """Gets the state of all currently running tasks (optionally for one profile) for a new client."""
     active_flows = OrderedDict()
     is_currently_running = False
 
     for flow_id, flow_data in running_tasks.items():
-        if flow_data.get('active', False):
+        if profile not in (None, flow_data.get("profile")):
+            continue
+        if flow_data.get('active', False) and not _is_stale(flow_data):
             is_currently_running = True
             active_tasks = OrderedDict()
             for task_id, task_data in flow_data.get('tasks', {}).items():
                 if task_data.get('status') == 'running':
                     active_tasks[task_id] = task_data
-            
+
             # 只包括至少有一个正在运行任务的流程
             if active_tasks:
                 active_flows[flow_id] = {
@@ -111,5 +208,6 @@ def get_current_state() -> dict:
     return {
         "type": "current_state",
         "is_running": is_currently_running,
-        "flows": active_flows
+        "flows": active_flows,
+        "queue": get_queue(profile)
     }
@@ -1,19 +1,99 @@
-from typing import List
+import json
+from typing import Dict, List, Optional, Set
 from fastapi import WebSocket
 
+# --- 订阅主题 ---
+# progress:       流程进度 (task_start / task_end / ticket_update，以及从日志中提取的 progress 消息)
+# logs:<taskId>:  某个任务的原始日志，logs:* 表示所有任务
+# data:           数据变化 (data_delta / data_updated)
+# 从未发送过订阅消息的客户端 (旧版本页面) 照常接收所有消息。
+EVENT_TOPICS = {
+    "task_start": "progress",
+    "task_end": "progress",
+    "ticket_update": "progress",
+    "data_delta": "data",
+    "data_updated": "data",
+}
+ALL_LOGS = "logs:*"
+
+
+def is_valid_topic(topic: str) -> bool:
+    return topic in ("progress", "data", ALL_LOGS) or (topic.startswith("logs:") and len(topic) > len("logs:"))
+
+
+def _progress_message(event: dict) -> Optional[dict]:
+    """从带有进度的日志事件中提取精简的 progress 消息"""
+    parsed = event.get("parsed")
+    if not parsed:
+        return None
+    data = parsed.get("data", {})
+    return {
+        "type": "progress",
+        "flowId": event.get("flowId"),
+        "taskId": event.get("taskId"),
+        "current": data.get("current", 0),
+        "total": data.get("total", 0),
+    }
+
+
 class ConnectionManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
+        # 每个连接查看的 profile
+        self.connection_profiles: Dict[WebSocket, str] = {}
+        # 发送过订阅消息的连接 -> 订阅的主题
+        self.subscriptions: Dict[WebSocket, Set[str]] = {}
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, profile: str = None):
         await websocket.accept()
         self.active_connections.append(websocket)
+        self.connection_profiles[websocket] = profile
 
     def disconnect(self, websocket: WebSocket):
         self.active_connections.remove(websocket)
+        self.connection_profiles.pop(websocket, None)
+        self.subscriptions.pop(websocket, None)
+
+    def subscribe(self, websocket: WebSocket, topics: List[str]) -> Set[str]:
+        """订阅主题，返回该连接当前订阅的全部主题"""
+        subscribed = self.subscriptions.setdefault(websocket, set())
+        subscribed.update(topics)
+        return subscribed
+
+    def unsubscribe(self, websocket: WebSocket, topics: List[str]) -> Set[str]:
+        """取消订阅，返回该连接当前订阅的全部主题 (取消全部后不再接收任何推送)"""
+        subscribed = self.subscriptions.setdefault(websocket, set())
+        subscribed.difference_update(topics)
+        return subscribed
+
+    def wants_logs(self, websocket: WebSocket, task_id: str) -> bool:
+        """该连接是否接收某个任务的日志 (从未订阅过的连接接收所有日志)"""
+        subscribed = self.subscriptions.get(websocket)
+        return subscribed is None or ALL_LOGS in subscribed or f"logs:{task_id}" in subscribed
+
+    async def broadcast(self, message: str, profile: str = None, event: dict = None):
+        """发送给查看该 profile 的连接 (profile 为空时发送给所有连接)，
+        已订阅主题的连接只接收其订阅的主题；没有 event 时按旧方式发送给所有连接"""
+        topic = None
+        if event is not None:
+            kind = event.get("type")
+            topic = f"logs:{event.get('taskId')}" if kind == "log" else EVENT_TOPICS.get(kind)
+        # 精简的进度消息只在有连接需要时才生成和序列化
+        progress_text = None
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+        for connection in list(self.active_connections):
+            if profile is not None and self.connection_profiles.get(connection) not in (None, profile):
+                continue
+            subscribed = self.subscriptions.get(connection)
+            if subscribed is None or event is None:
+                await connection.send_text(message)
+            elif topic in subscribed or (topic and topic.startswith("logs:") and ALL_LOGS in subscribed):
+                await connection.send_text(message)
+            elif event.get("type") == "log" and "progress" in subscribed:
+                if progress_text is None:
+                    progress = _progress_message(event)
+                    progress_text = json.dumps(progress, ensure_ascii=False) if progress else ""
+                if progress_text:
+                    await connection.send_text(progress_text)
 
 manager = ConnectionManager()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+模拟 venera 无头模式的假可执行文件，仅用于基准测试。
+
+按照 headless_doc.md 中描述的格式输出 `[CLI PRINT]` 流，
+所有参数都通过环境变量传入，这样 `run_venera_command_streamed`
+拼接出的命令行无需任何修改即可直接调用本脚本。
+"""
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# --- 参数 (环境变量) ---
+COMICS = int(os.getenv("FAKE_VENERA_COMICS", 200))
+# 每秒输出的行数，0 表示不限速
+RATE = float(os.getenv("FAKE_VENERA_RATE", 0))
+# 产生 ProgressError 的漫画比例
+ERROR_RATIO = float(os.getenv("FAKE_VENERA_ERROR_RATIO", 0.05))
+# 每一轮中有内容更新的漫画比例
+UPDATE_RATIO = float(os.getenv("FAKE_VENERA_UPDATE_RATIO", 0.1))
+# Progress 行的目标字节数，不足时用 description 字段填充，0 表示不填充
+LINE_BYTES = int(os.getenv("FAKE_VENERA_LINE_BYTES", 0))
+# 每部漫画额外输出的普通日志行数
+NOISE_LINES = int(os.getenv("FAKE_VENERA_NOISE_LINES", 1))
+COVER_BASE = os.getenv("FAKE_VENERA_COVER_BASE", "http://127.0.0.1:1/covers")
+ROUND = int(os.getenv("FAKE_VENERA_ROUND", 0))
+SEED = os.getenv("FAKE_VENERA_SEED", "venera-bench")
+
+BASE_TIME = datetime(2024, 1, 1)
+SOURCES = ["copy_manga", "picacg", "ehentai", "jm", "nhentai"]
+PREFIX = "[CLI PRINT] "
+
+_last_emit = 0.0
+
+
+def emit(line: str):
+    """输出一行，并按 RATE 限速"""
+    global _last_emit
+    if RATE > 0:
+        wait = _last_emit + 1.0 / RATE - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        _last_emit = time.monotonic()
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+def emit_json(status: str, message: str, data=None):
+    payload = {"status": status, "message": message}
+    if data is not None:
+        payload["data"] = data
+    emit(PREFIX + json.dumps(payload, ensure_ascii=False))
+
+
+def chance(*parts) -> float:
+    """根据种子和参数得到一个确定性的随机数，保证多次调用之间结果一致"""
+    return random.Random("-".join(str(p) for p in (SEED, *parts))).random()
+
+
+def last_update_round(index: int) -> int:
+    """漫画 index 在当前轮次及之前最后一次更新的轮次"""
+    latest = 0
+    for r in range(1, ROUND + 1):
+        if chance("update", r, index) < UPDATE_RATIO:
+            latest = r
+    return latest
+
+
+def make_comic(index: int) -> dict:
+    update_round = last_update_round(index)
+    update_time = BASE_TIME + timedelta(hours=index) + timedelta(days=update_round)
+    comic = {
+        "id": f"comic-{index:06d}",
+        "name": f"测试漫画 {index:05d} Synthetic Comic",
+        "coverUrl": f"{COVER_BASE}/{index:06d}.jpg",
+        "author": f"作者{index % 97} Author {index % 97}",
+        "type": SOURCES[index % len(SOURCES)],
+        "updateTime": update_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "tags": [f"标签{index % 13}", f"tag{index % 7}", "bench"],
+    }
+    return comic
+
+
+def progress_payload(message: str, current: int, total: int, comic: dict, error: str = None) -> dict:
+    data = {"current": current, "total": total, "comic": comic}
+    if error:
+        data["error"] = error
+    if LINE_BYTES > 0:
+        size = len(json.dumps({"status": "running", "message": message, "data": data}, ensure_ascii=False)) + len(PREFIX)
+        if size < LINE_BYTES:
+            comic["description"] = "x" * (LINE_BYTES - size - len(', "description": ""'))
+    return data
+
+
+def run_updatesubscribe(indices):
+    total = len(indices)
+    updated = []
+    for current, index in enumerate(indices, start=1):
+        comic = make_comic(index)
+        for n in range(NOISE_LINES):
+            emit(f"[INFO] ({current}/{total}) 正在获取 {comic['type']}:{comic['id']} 第 {n + 1} 步")
+        if chance("error", ROUND, index) < ERROR_RATIO:
+            data = progress_payload("ProgressError", current, total, comic, "Network error: connection reset")
+            emit_json("running", "ProgressError", data)
+            continue
+        data = progress_payload("Progress", current, total, comic)
+        emit_json("running", "Progress", data)
+        if ROUND > 0 and last_update_round(index) == ROUND:
+            updated.append(comic)
+    emit_json("success", "Updated comics list.", updated)
+
+
+def run_updatescript():
+    total = len(SOURCES)
+    errors = 0
+    for current, key in enumerate(SOURCES, start=1):
+        source = {"key": key, "name": key, "version": "1.0.0", "url": f"https://example.com/{key}.js"}
+        if chance("script", ROUND, key) < ERROR_RATIO:
+            errors += 1
+            emit_json("running", "ProgressError", {"current": current, "total": total, "source": source, "error": "timeout"})
+        else:
+            emit_json("running", "Progress", {"current": current, "total": total, "source": source})
+    emit_json("success", "All scripts updated.", {"total": total, "updated": total - errors, "errors": errors})
+
+
+def main(argv):
+    args = [a for a in argv if a not in ("--headless", "--ignore-disheadless-log")]
+    if not args:
+        print("usage: fake_venera.py --headless <command> [subcommand] [options]", file=sys.stderr)
+        return 2
+
+    command = args[0]
+    if command == "webdav":
+        direction = args[1] if len(args) > 1 else "down"
+        emit(f"[INFO] WebDAV {direction}: connecting to https://dav.example.com")
+        emit(f"[INFO] WebDAV {direction}: done")
+    elif command == "updatescript":
+        run_updatescript()
+    elif command == "updatesubscribe":
+        if "--update-comic-by-id-type" in args:
+            comic_id = args[args.index("--update-comic-by-id-type") + 1]
+            index = int(comic_id.rsplit("-", 1)[-1])
+            run_updatesubscribe([index])
+        else:
+            run_updatesubscribe(range(COMICS))
+    else:
+        print(f"unknown command: {command}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+离线基准测试：用假的 venera、本地封面服务器、本地 SMTP 接收端和
+模拟的 WebSocket 客户端驱动完整的 `run_update_flow`，不依赖真实的
+venera、网络漫画源或邮件服务器。
+
+用法:
+    python bench/run_bench.py --comics 1000 --clients 20 --output bench.json
+    python bench/run_bench.py --baseline bench.json   # 与之前的结果比较
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import shlex
+import smtplib
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_VENERA = os.path.join(REPO_ROOT, "bench", "fake_venera.py")
+
+# 与基线比较时使用的指标，以及数值越大越好还是越小越好
+COMPARED_METRICS = {
+    "flow_wall_seconds": "lower",
+    "lines_per_second": "higher",
+    "broadcast_latency_ms.p50": "lower",
+    "broadcast_latency_ms.p99": "lower",
+    "save_data_ms.mean": "lower",
+    "peak_rss_mb": "lower",
+}
+
+
+# --- 本地封面服务器 ---
+
+class CoverHandler(BaseHTTPRequestHandler):
+    cover_bytes = 20 * 1024
+    latency = 0.0
+    missing_ratio = 0.0
+    served = 0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        name = os.path.basename(self.path)
+        if random.Random(name).random() < self.missing_ratio:
+            self.send_error(404)
+            return
+        body = (name.encode() * (self.cover_bytes // max(len(name), 1) + 1))[:self.cover_bytes]
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        type(self).served += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+# --- 本地 SMTP 接收端 ---
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """只实现 smtplib 发送邮件所需的最小 SMTP 子集，收到的邮件只计数不保存"""
+    received = 0
+    lock = threading.Lock()
+
+    def reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.reply("220 localhost bench SMTP sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode(errors="replace").strip().split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-localhost")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif verb == "AUTH":
+                self.reply("235 Authentication successful")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with self.lock:
+                    type(self).received += 1
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class PlainSMTP(smtplib.SMTP):
+    """替代 SMTP_SSL，让邮件以明文发往本地接收端"""
+
+    def __init__(self, host="", port=0, timeout=10, **kwargs):
+        super().__init__(host, port, timeout=timeout)
+
+
+def start_server(server) -> threading.Thread:
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+# --- 模拟的 WebSocket 客户端 ---
+
+class BroadcastProbe:
+    """包装 ConnectionManager.broadcast，统计每条消息到达每个客户端的延迟"""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.original = manager.broadcast
+        self.started = 0.0
+        self.latencies = []
+        self.log_lines = 0
+        self.messages = 0
+        self.data_updated_at = None
+
+    async def broadcast(self, message: str, profile: str = None, event: dict = None):
+        self.messages += 1
+        if message.startswith('{"type": "log"'):
+            self.log_lines += 1
+        elif message.startswith(('{"type": "data_updated"', '{"type": "data_delta"')):
+            self.data_updated_at = time.perf_counter()
+        self.started = time.perf_counter()
+        await self.original(message, profile, event)
+
+    def reset(self):
+        self.latencies = []
+        self.log_lines = 0
+        self.messages = 0
+        self.data_updated_at = None
+
+
+class FakeClient:
+    def __init__(self, probe: BroadcastProbe):
+        self.probe = probe
+        self.received_bytes = 0
+
+    async def send_text(self, message: str):
+        self.received_bytes += len(message)
+        self.probe.latencies.append(time.perf_counter() - self.probe.started)
+
+
+class SaveDataProbe:
+    def __init__(self, original):
+        self.original = original
+        self.durations = []
+
+    def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.original(*args, **kwargs)
+        finally:
+            self.durations.append(time.perf_counter() - started)
+
+
+# --- 统计 ---
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize_ms(values) -> dict:
+    ms = [v * 1000 for v in values]
+    return {
+        "count": len(ms),
+        "mean": sum(ms) / len(ms) if ms else 0.0,
+        "p50": percentile(ms, 50),
+        "p90": percentile(ms, 90),
+        "p99": percentile(ms, 99),
+        "max": max(ms) if ms else 0.0,
+    }
+
+
+def peak_rss_mb(who) -> float:
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def lookup(result: dict, dotted: str):
+    value = result
+    for part in dotted.split("."):
+        value = value[part]
+    return value
+
+
+# --- 基准流程 ---
+
+async def run_rounds(args, services, config, probe, save_probe):
+    from app.bus import bus
+    # 与应用启动时一样连接事件总线 (EVENT_BUS_BACKEND=sqlite 时会轮询其他进程的事件)
+    await bus.start()
+    rounds = []
+    for round_no in range(args.rounds):
+        os.environ["FAKE_VENERA_ROUND"] = str(round_no)
+        probe.reset()
+        save_probe.durations = []
+        emails_before = SMTPSinkHandler.received
+        covers_before = CoverHandler.served
+
+        started = time.perf_counter()
+        await services.run_update_flow()
+        finished = time.perf_counter()
+        # run_update_flow 结束前会为迟到的客户端保留流程状态几秒，这段时间不计入流程耗时
+        flow_end = probe.data_updated_at or finished
+        flow_seconds = flow_end - started
+
+        rounds.append({
+            "round": round_no,
+            "flow_wall_seconds": flow_seconds,
+            "total_wall_seconds": finished - started,
+            "log_lines": probe.log_lines,
+            "lines_per_second": probe.log_lines / flow_seconds if flow_seconds else 0.0,
+            "broadcasts": probe.messages,
+            "broadcast_latency_ms": summarize_ms(probe.latencies),
+            "save_data_ms": summarize_ms(save_probe.durations),
+            "data_file_bytes": os.path.getsize(config.DATA_FILE) if os.path.exists(config.DATA_FILE) else 0,
+            "covers_fetched": CoverHandler.served - covers_before,
+            "emails_sent": SMTPSinkHandler.received - emails_before,
+        })
+        r = rounds[-1]
+        print(f"第 {round_no} 轮: 流程 {r['flow_wall_seconds']:.2f}s, {r['lines_per_second']:.0f} 行/秒, "
+              f"广播 p99 {r['broadcast_latency_ms']['p99']:.2f}ms, save_data {r['save_data_ms']['mean']:.1f}ms, "
+              f"封面 {r['covers_fetched']}, 邮件 {r['emails_sent']}")
+    await bus.stop()
+    return rounds
+
+
+def aggregate(rounds) -> dict:
+    # 第 0 轮从空数据开始，与后续轮次的负载不同，汇总时只使用后续轮次 (只有一轮时除外)
+    steady = rounds[1:] or rounds
+    flow = [r["flow_wall_seconds"] for r in steady]
+    lines = sum(r["log_lines"] for r in steady)
+    return {
+        "flow_wall_seconds": sum(flow) / len(flow),
+        "lines_per_second": lines / sum(flow) if sum(flow) else 0.0,
+        "broadcast_latency_ms": {
+            "p50": sum(r["broadcast_latency_ms"]["p50"] for r in steady) / len(steady),
+            "p99": max(r["broadcast_latency_ms"]["p99"] for r in steady),
+        },
+        "save_data_ms": {
+            "mean": sum(r["save_data_ms"]["mean"] for r in steady) / len(steady),
+        },
+    }
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> bool:
+    """打印与基线的对比，返回是否存在超过阈值的退化"""
+    regressed = False
+    print(f"\n{'指标':<28}{'基线':>12}{'本次':>12}{'变化':>10}")
+    for metric, better in COMPARED_METRICS.items():
+        try:
+            old = lookup(baseline["summary"], metric)
+            new = lookup(result["summary"], metric)
+        except (KeyError, TypeError):
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = change > threshold if better == "lower" else change < -threshold
+        regressed = regressed or worse
+        flag = "  <-- 退化" if worse else ""
+        print(f"{metric:<28}{old:>12.3f}{new:>12.3f}{change:>+10.1%}{flag}")
+    return regressed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Venera-Sub-Alert 离线基准测试")
+    parser.add_argument("--comics", type=int, default=500, help="合成漫画数量")
+    parser.add_argument("--rounds", type=int, default=3, help="执行 run_update_flow 的轮数 (第 0 轮从空数据开始)")
+    parser.add_argument("--rate", type=float, default=0, help="假 venera 每秒输出的行数，0 表示不限速")
+    parser.add_argument("--error-ratio", type=float, default=0.05, help="ProgressError 的比例")
+    parser.add_argument("--update-ratio", type=float, default=0.1, help="每轮有内容更新的漫画比例")
+    parser.add_argument("--line-bytes", type=int, default=0, help="Progress 行的目标字节数")
+    parser.add_argument("--noise-lines", type=int, default=1, help="每部漫画额外的普通日志行数")
+    parser.add_argument("--cover-bytes", type=int, default=20 * 1024, help="每张封面的字节数")
+    parser.add_argument("--cover-latency-ms", type=float, default=0, help="封面服务器的响应延迟")
+    parser.add_argument("--cover-missing-ratio", type=float, default=0.02, help="封面返回 404 的比例")
+    parser.add_argument("--clients", type=int, default=10, help="模拟的 WebSocket 客户端数量")
+    parser.add_argument("--seed", default="venera-bench", help="合成数据的随机种子")
+    parser.add_argument("--workdir", help="工作目录 (默认使用临时目录)")
+    parser.add_argument("--output", help="将结果以 JSON 格式写入该文件")
+    parser.add_argument("--baseline", help="与之前保存的 JSON 结果进行比较")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="与基线比较时允许的最大退化比例，超过则以非零状态码退出")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # 相对路径 (--output/--baseline) 以调用时的目录为准
+    invoked_from = os.getcwd()
+
+    # 在独立的工作目录中运行，data.json 和封面缓存都不会污染仓库
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="venera-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+
+    CoverHandler.cover_bytes = args.cover_bytes
+    CoverHandler.latency = args.cover_latency_ms / 1000
+    CoverHandler.missing_ratio = args.cover_missing_ratio
+    # 流程会并发请求所有封面，默认的监听队列 (5) 太小会导致连接被拒绝
+    ThreadingHTTPServer.request_queue_size = 1024
+    cover_server = ThreadingHTTPServer(("127.0.0.1", 0), CoverHandler)
+    cover_server.daemon_threads = True
+    start_server(cover_server)
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    smtp_server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPSinkHandler)
+    smtp_server.daemon_threads = True
+    start_server(smtp_server)
+
+    os.environ.update({
+        "FAKE_VENERA_COMICS": str(args.comics),
+        "FAKE_VENERA_RATE": str(args.rate),
+        "FAKE_VENERA_ERROR_RATIO": str(args.error_ratio),
+        "FAKE_VENERA_UPDATE_RATIO": str(args.update_ratio),
+        "FAKE_VENERA_LINE_BYTES": str(args.line_bytes),
+        "FAKE_VENERA_NOISE_LINES": str(args.noise_lines),
+        "FAKE_VENERA_COVER_BASE": f"http://127.0.0.1:{cover_server.server_address[1]}/covers",
+        "FAKE_VENERA_SEED": args.seed,
+        "NO_PROXY": "127.0.0.1,localhost",
+    })
+
+    from app import config, services, main as app_main
+    from app.websocket import manager
+
+    config.MAIL_SERVER = "127.0.0.1"
+    config.MAIL_PORT = smtp_server.server_address[1]
+    config.MAIL_USERNAME = "bench@example.com"
+    config.MAIL_PASSWORD = "bench"
+    config.MAIL_RECIPIENT = "reader@example.com"
+    smtplib.SMTP_SSL = PlainSMTP
+    app_main.VENERA_TMP_PATH = f"{shlex.quote(sys.executable)} {shlex.quote(FAKE_VENERA)}"
+
+    probe = BroadcastProbe(manager)
+    manager.broadcast = probe.broadcast
+    manager.active_connections.extend(FakeClient(probe) for _ in range(args.clients))
+    save_probe = SaveDataProbe(services.save_data)
+    services.save_data = save_probe
+
+    print(f"工作目录: {workdir}")
+    rounds = asyncio.run(run_rounds(args, services, config, probe, save_probe))
+
+    summary = aggregate(rounds)
+    summary["peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_SELF)
+    summary["peak_child_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "workdir")},
+        },
+        "rounds": rounds,
+        "summary": summary,
+    }
+
+    print(f"\n平均流程耗时 {summary['flow_wall_seconds']:.2f}s, {summary['lines_per_second']:.0f} 行/秒, "
+          f"广播延迟 p50 {summary['broadcast_latency_ms']['p50']:.3f}ms / p99 {summary['broadcast_latency_ms']['p99']:.3f}ms, "
+          f"峰值 RSS {summary['peak_rss_mb']:.1f}MB")
+
+    if args.output:
+        output = os.path.join(invoked_from, args.output)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {output}")
+
+    cover_server.shutdown()
+    smtp_server.shutdown()
+
+    if args.baseline:
+        with open(os.path.join(invoked_from, args.baseline), "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(result, baseline, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())